@@ -1,3 +0,0 @@
-from backend.neural_search import NeuralSearcher
-
-search_bar = NeuralSearcher(collection_name)
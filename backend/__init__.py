@@ -1,2 +1,10 @@
 from .config import *
-from .api import app
+
+
+def __getattr__(name):
+    # the api imports flask and the searcher, only when it's asked for
+    if name == "app":
+        from .api import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
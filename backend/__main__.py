@@ -1,21 +1,13 @@
 import rich
 import click
-from qdrant_client import QdrantClient
 from rich import box
 from rich.panel import Panel
+from rich.table import Table
 
-from . import config
-from .api import app
-from .laptops.embed_laptops import (
-    NeuralSearcher,
-    cohere,
-    embed_laptops,
-    qdrant,
-    upload_to_cluster,
-)
-from .schema import walk_json_tree
-
-searcher = NeuralSearcher(config.LAPTOPS_COLLECTION_NAME)
+from . import config, deadline, metrics
+
+# the search stack and the api are imported by the commands that use them,
+# so `--help` and building don't load what they don't need
 console = rich.get_console()
 
 @click.group()
@@ -24,26 +16,81 @@ def cli():
     pass
 
 
+def up_to_date(path, db) -> bool:
+    """Check that a file built from a database is newer than it."""
+    return path.exists() and path.stat().st_mtime >= db.stat().st_mtime
+
+
 @cli.command()
+@click.option(
+    "-c", "--category", default="laptops", show_default=True,
+    type=click.Choice(["laptops", "phones"]), help="the catalog to build")
 @click.option("-e", "--embed", is_flag=True)
 @click.option("-u", "--upload", is_flag=True)
-def build(embed, upload):
+@click.option("-p", "--payloads", is_flag=True, help="rebuild the payload store")
+@click.option("-l", "--lexical", is_flag=True, help="rebuild the lexical index")
+@click.option("-a", "--ann", is_flag=True, help="build an approximate search index")
+@click.option("--ann-lists", type=int, help="the number of lists of the index")
+@click.option(
+    "-q", "--quantize",
+    type=click.Choice(["int8", "float16"]), help="quantize the embeddings")
+@click.option(
+    "--languages", metavar="fr,es,...",
+    help="translate the descriptions to these languages ahead of time")
+def build(
+    category, embed, upload, payloads, lexical, ann, ann_lists, quantize, languages
+):
     """Embed and Upload Data."""
-    if config.LAPTOP_VECTORS.exists() and not embed:
-        console.log(f"Embeddings found in {config.LAPTOP_VECTORS}.")
+    from .categories import get_category
+    from .laptops.embed_laptops import (
+        build_ann_index,
+        build_lexical_index,
+        build_payload_store,
+        build_quantized_vectors,
+        build_translations,
+        embed_laptops,
+        get_qdrant,
+        upload_to_cluster,
+    )
+
+    category = get_category(category)
+    if up_to_date(category.store, category.db) and not payloads:
+        console.log(f"Payload store found in {category.store}.")
+    else:
+        with console.status("Building Payload Store"):
+            build_payload_store(category)
+    if up_to_date(category.lexical, category.db) and not lexical:
+        console.log(f"Lexical index found in {category.lexical}.")
     else:
-        with console.status("Embedding Laptops"):
-            embed_laptops()
+        with console.status("Building Lexical Index"):
+            build_lexical_index(category)
+    if languages:
+        # resumes where an interrupted build stopped
+        build_translations(
+            [lang.strip() for lang in languages.split(",") if lang.strip()],
+            category,
+        )
+    if category.vectors.exists() and not embed:
+        console.log(f"Embeddings found in {category.vectors}.")
+    else:
+        with console.status(f"Embedding {category.name.capitalize()}"):
+            embed_laptops(category)
+    if ann:
+        with console.status("Building Approximate Search Index"):
+            build_ann_index(lists=ann_lists, category=category)
+    if quantize:
+        with console.status("Quantizing Embeddings"):
+            build_quantized_vectors(quantize, category=category)
     try:
-        qdrant.get_collection(config.LAPTOPS_COLLECTION_NAME)
+        get_qdrant().get_collection(category.collection_name)
         if not upload:
             console.log(
-                f"Collection {config.LAPTOPS_COLLECTION_NAME!r} exists.")
+                f"Collection {category.collection_name!r} exists.")
     except Exception as exc:
         upload = True
     if upload:
         with console.status("Uploading Embeddings"):
-            upload_to_cluster()
+            upload_to_cluster(category)
 
 
 def print_results(results: list):
@@ -54,9 +101,12 @@ def print_results(results: list):
                 f"[on red]{p['price']:.2f}[/]" for p in result['prices']
             ),
             f"[blue]info: [/] {result['info']}",
-            f"[blue]target users: [/] {result['target_user']}",
-            result['description']
         ]
+        # crawled phones have no target users nor description
+        if result.get('target_user'):
+            body.append(f"[blue]target users: [/] {result['target_user']}")
+        if result.get('description'):
+            body.append(result['description'])
         panel = Panel(
             "\n\n".join(body),
             border_style="yellow",
@@ -69,30 +119,94 @@ def print_results(results: list):
     console.rule()
 
 
+def print_timing(timing: dict):
+    """Print the timing breakdown of a search."""
+    table = Table(title=f"{timing['total_ms']:.1f}ms", box=box.SIMPLE)
+    table.add_column("stage")
+    table.add_column("wall time", justify="right")
+    for stage, ms in timing["stages_ms"].items():
+        table.add_row(stage, f"{ms:.1f}ms")
+    rich.print(table)
+    calls = ", ".join(f"{name}: {n}" for name, n in timing["upstream_calls"].items())
+    caches = ", ".join(
+        f"{name}: {c['hits']} hits / {c['misses']} misses"
+        for name, c in timing["caches"].items()
+    )
+    console.print(f"[blue]upstream calls:[/] {calls or 'none'}")
+    console.print(f"[blue]upstream bytes:[/] {timing['upstream_bytes']}")
+    console.print(f"[blue]caches:[/] {caches or 'none'}")
+    console.print(f"[blue]translated characters:[/] {timing['translated_chars']}")
+    console.rule()
+
+
 @cli.command()
 @click.option('-l', '--limit',
     type=int, help="limit the number of results", default=5)
 @click.option('-j', '--json', is_flag=True, help="produce output in json format")
-def interactive(limit, json):
+@click.option('-t', '--timing', is_flag=True, help="show the timing of each search")
+@click.option(
+    '-d', '--deadline', 'seconds', type=float, default=config.SEARCH_DEADLINE,
+    show_default=True, help="seconds before a search degrades, 0 to wait")
+def interactive(limit, json, timing, seconds):
     """Run SalesMan interactively."""
+    from .laptops.embed_laptops import get_searcher
+
+    searcher = get_searcher()
     while True:
         try:
-            text = console.input("search for a laptop: ")
+            text = console.input("search for a gadget: ")
         except (EOFError, KeyboardInterrupt):
             print()
             break
-        results = searcher.search(text, limit=limit)
+        with metrics.tracing(timing) as trace:
+            if seconds:
+                with deadline.budget(seconds) as budget:
+                    results = searcher.search(text, limit=limit)
+                degraded = sorted(budget.degraded)
+            else:
+                results, degraded = searcher.search(text, limit=limit), []
+            breakdown = trace.to_dict() if trace is not None else None
         if json:
-            print(results)
+            output = {"recommendations": results}
+            if breakdown is not None:
+                output["timing"] = breakdown
+            if degraded:
+                output["degraded"] = degraded
+            print(results if len(output) == 1 else output)
         else:
             print_results(results)
+            if degraded:
+                console.print(f"[yellow]degraded:[/] {', '.join(degraded)}")
+            if breakdown is not None:
+                print_timing(breakdown)
+
+
+@cli.command()
+def reload():
+    """Make running servers load the catalog again."""
+    from .catalog import CatalogVersion
+
+    version = CatalogVersion(config.CATALOG_VERSION).bump()
+    console.log(f"Catalog version is now {version}.")
 
 
 @cli.command()
 @click.option('--host', help="host to use")
 @click.option('--port', help="port to use")
-def web(host, port):
+@click.option(
+    '-w', '--workers', type=int,
+    help="serve the ASGI app with this many worker processes")
+def web(host, port, workers):
     """Serve Salesman on the web."""
+    if workers:
+        from .asgi import serve
+
+        serve(host=host or "127.0.0.1", port=int(port or 5000), workers=workers)
+        return
+    from .api import app, searcher
+
+    searcher.preload()
+    searcher.watch()
     if host and port:
         app.run(host=host, port=port)
     elif host:
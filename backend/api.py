@@ -2,20 +2,390 @@
 is basically a wrapper function for our searcher and a fast api
 which broadcasts our information."""
 
-from flask import Flask, jsonify, request
-from .laptops.embed_laptops import NeuralSearcher
-from .config import LAPTOPS_COLLECTION_NAME
+import hashlib
+import hmac
+import time
+
+from flask import Flask, Response, g, jsonify, request
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from . import deadline, metrics
+from .cache import create_cache
+from .deadline import DeadlineExceeded
+from .encoding import dumps, encode_response, loads, parse_fields, project
+from .laptops.embed_laptops import (
+    CursorError,
+    catalog_version,
+    get_searcher,
+    normalize_query,
+)
+from .config import (
+    ADMIN_TOKEN,
+    RESPONSE_CACHE_DB,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    SEARCH_BATCH_MAX_QUERIES,
+    SEARCH_MAX_LIMIT,
+)
 from flask_cors import CORS
 
 
 app = Flask(__name__)
 CORS(app)
-searcher = NeuralSearcher(LAPTOPS_COLLECTION_NAME)
+searcher = get_searcher()
+responses = create_cache(
+    "responses",
+    maxsize=RESPONSE_CACHE_SIZE,
+    ttl=RESPONSE_CACHE_TTL,
+    path=RESPONSE_CACHE_DB,
+    disk_maxsize=RESPONSE_CACHE_SIZE,
+)
+
+
+def collect_metrics() -> None:
+    """Update the metrics of the response cache."""
+    metrics.CACHE_HITS.set(responses.hits, "responses")
+    metrics.CACHE_MISSES.set(responses.misses, "responses")
+
+
+metrics.on_collect(collect_metrics)
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+SSE = "text/event-stream"
+
+
+def response_key(query: str, limit: int, fields) -> str:
+    """
+    Key the first page of results of a query.
+
+    Results are translated to the language of the query, so the
+    normalized query stands for its language as well. The version is the
+    one of the snapshots searched, a response is never cached under the
+    version of a snapshot that isn't swapped in yet.
+    """
+    projection = "full" if fields is None else ",".join(fields)
+    return f"{searcher.version}:{limit}:{projection}:{normalize_query(query)}"
+
+
+def etag(body: bytes) -> str:
+    """
+    Tag a response by its body.
+
+    The body has the `next_cursor` of the page, so a response cached
+    again after its cursor expired gets a new tag, and a client never
+    keeps a page whose cursor is gone.
+    """
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def not_modified(if_none_match, tag: str) -> bool:
+    """Check an `If-None-Match` header against the tag of a response."""
+    if not if_none_match:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in tags or tag.removeprefix("W/") in tags
+
+
+def cache_headers(tag: str) -> dict[str, str]:
+    """Let clients keep a response, checking that it's fresh on every use."""
+    return {"ETag": tag, "Cache-Control": "no-cache"}
+
+
+# degraded responses are not kept, the next request may do better
+DEGRADED_HEADERS = {"Cache-Control": "no-store"}
+
+
+def negotiate(accept) -> str:
+    """Choose between a json response and a stream from an `Accept` header."""
+    return parse_accept_header(accept, MIMEAccept).best_match([JSON, NDJSON, SSE], JSON)
+
+
+def stream_events(query, limit, cursor, fields):
+    """
+    Stream a page of results as events.
+
+    Every recommendation is sent untranslated as soon as it's found,
+    projected to `fields`, then
+    a `translation` event follows for each description as it's translated
+    and a final `done` event carries the cursor of the next page and the
+    stages that degraded to meet the deadline.
+    """
+    budget = deadline.Deadline()
+    with deadline.budget(budget):
+        recommendations, lang, next_cursor = searcher.rank_page(
+            query, limit=limit, cursor=cursor
+        )
+
+    def events():
+        for laptop in recommendations:
+            yield "recommendation", project(laptop, fields)
+        with deadline.budget(budget):
+            translations = searcher.translations(recommendations, lang)
+            for category, _id, description in translations:
+                yield "translation", {
+                    "category": category, "id": _id, "description": description
+                }
+        yield "done", {
+            "next_cursor": next_cursor, "degraded": sorted(budget.degraded)
+        }
+
+    return events()
+
+
+def ndjson_event(event: str, data) -> bytes:
+    """Format an event as a line of json."""
+    return dumps({"event": event, "data": data}) + b"\n"
+
+
+def sse_event(event: str, data) -> bytes:
+    """Format an event as a server-sent event."""
+    return b"event: %s\ndata: %s\n\n" % (event.encode(), dumps(data))
+
+
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def authorized(authorization) -> bool:
+    """Check an `Authorization` header against `ADMIN_TOKEN`."""
+    if not ADMIN_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        token.strip().encode(), ADMIN_TOKEN.encode()
+    )
+
+
+def reload_catalog() -> str:
+    """
+    Load the catalog again in the background.
+
+    The catalog version is changed, so the other workers reload as well
+    and the cached responses of the old catalog are dropped.
+
+    Returns:
+        The new catalog version
+    """
+    version = catalog_version.bump()
+    searcher.reload_in_background()
+    return version
+
+
+def parse_limit(value) -> int:
+    """
+    Validate the number of results a search asks for.
+
+    Raises:
+        ValueError: when it isn't a whole number from 1 to `SEARCH_MAX_LIMIT`
+    """
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid limit: {value!r}") from None
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise ValueError(f"limit must be from 1 to {SEARCH_MAX_LIMIT}, got {limit}")
+    return limit
+
+
+def parse_batch(body) -> tuple[list[str], list[int]]:
+    """
+    Validate the body of a batch search.
+
+    Args:
+        body: a json object with a list of `queries`, each query is either
+            a string or an object with a `query` and an optional `limit`,
+            and optional `fields`, see `encoding.parse_fields`
+    Returns:
+        The queries and their limits
+    Raises:
+        ValueError: when the body is invalid
+    """
+    body = body if isinstance(body, dict) else {}
+    queries = body.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("expected a non-empty list of queries")
+    if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise ValueError(f"expected at most {SEARCH_BATCH_MAX_QUERIES} queries")
+    texts, limits = [], []
+    for query in queries:
+        if isinstance(query, str):
+            query = {"query": query}
+        if not isinstance(query, dict) or not isinstance(query.get("query"), str):
+            raise ValueError(f"invalid query: {query!r}")
+        try:
+            limits.append(parse_limit(query.get("limit", body.get("limit", 5))))
+        except ValueError as error:
+            raise ValueError(f"{error} in query {query!r}") from None
+        texts.append(query["query"])
+    return texts, limits
+
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.inc(request.endpoint)
+
+
+@app.after_request
+def count_errors(response):
+    # unhandled exceptions get here as a 500 too, they are only counted here
+    if response.status_code >= 500:
+        metrics.REQUEST_ERRORS.inc(request.endpoint)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress json responses, see `encoding.encode_response`."""
+    if response.mimetype != JSON or response.is_streamed:
+        return response
+    body, coding = encode_response(
+        response.get_data(), request.headers.get("Accept-Encoding")
+    )
+    response.vary.add("Accept-Encoding")
+    if coding is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = coding
+    return response
+
+
+@app.teardown_request
+def finish_request(error):
+    metrics.REQUESTS_IN_FLIGHT.dec(request.endpoint)
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - g.started, request.endpoint
+    )
+
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(error):
+    return jsonify({"error": str(error)}), 504
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose the metrics in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Swap in a new snapshot of the catalog without a restart.
+
+    Needs `Authorization: Bearer <SALESMAN_ADMIN_TOKEN>`, the route is
+    disabled when no token is set.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "not found"}), 404
+    if not authorized(request.headers.get("Authorization")):
+        return jsonify({"error": "unauthorized"}), 401
+    return jsonify({"version": reload_catalog()}), 202
+
 
 @app.route('/search/<query>', methods=['GET'])
 def search(query):
-    limit = request.args.get("limit", 5)
-    limit = int(limit)
-    return jsonify({
-        'recommendations': searcher.search(query, limit=limit)
-    })
+    """
+    Search for laptops, one page at a time.
+
+    The response has a `next_cursor` to pass as `cursor` with the same
+    query to get the next page, it's `null` on the last page. The `limit`
+    of a page is from 1 to `SEARCH_MAX_LIMIT`. Results are streamed when
+    `application/x-ndjson` or `text/event-stream` is accepted, see
+    `stream_events`. Recommendations are projected to the
+    comma separated `fields`, a slim profile by default, see
+    `encoding.parse_fields`. First pages are cached until the catalog
+    changes or shortly before their cursor expires, and answer
+    `If-None-Match` with `304 Not Modified` while they are.
+    With `debug=timing`, a json response has the `timing` of the request
+    next to its `recommendations`, see `metrics.Trace`. Searches have a
+    latency budget, see `deadline.py`, the stages that degraded to meet
+    it are listed in `degraded` and such responses are not cached.
+    """
+    cursor = request.args.get("cursor")
+    try:
+        limit = parse_limit(request.args.get("limit", 5))
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    mimetype = negotiate(request.headers.get("Accept"))
+    try:
+        if mimetype == NDJSON:
+            events = stream_events(query, limit, cursor, fields)
+            return Response(
+                (ndjson_event(*event) for event in events),
+                mimetype=NDJSON,
+                headers=STREAM_HEADERS,
+            )
+        if mimetype == SSE:
+            events = stream_events(query, limit, cursor, fields)
+            return Response(
+                (sse_event(*event) for event in events),
+                mimetype=SSE,
+                headers=STREAM_HEADERS,
+            )
+    except CursorError as error:
+        return jsonify({"error": str(error)}), 410
+    timing = request.args.get("debug") == "timing"
+    with metrics.tracing(timing) as trace, deadline.budget() as budget:
+        if cursor is not None:
+            try:
+                recommendations, next_cursor = searcher.search_page(
+                    query, limit=limit, cursor=cursor
+                )
+            except CursorError as error:
+                return jsonify({"error": str(error)}), 410
+            with metrics.stage("encode"):
+                page = {
+                    'recommendations': [project(r, fields) for r in recommendations],
+                    'next_cursor': next_cursor,
+                    'degraded': sorted(budget.degraded),
+                }
+                if trace is not None:
+                    page['timing'] = trace.to_dict()
+                body = dumps(page)
+            return Response(body, mimetype=JSON)
+        key = response_key(query, limit, fields)
+        body = responses.get(key)
+        metrics.record_cache("responses", body is not None, body is None)
+        if body is None:
+            recommendations, next_cursor = searcher.search_page(query, limit=limit)
+            with metrics.stage("encode"):
+                body = dumps({
+                    'recommendations': [project(r, fields) for r in recommendations],
+                    'next_cursor': next_cursor,
+                    'degraded': sorted(budget.degraded),
+                })
+            if not budget.degraded:
+                responses.set(key, body)
+        if budget.degraded:
+            headers = DEGRADED_HEADERS
+        else:
+            headers = cache_headers(etag(body))
+            if not timing and not_modified(
+                request.headers.get("If-None-Match"), headers["ETag"]
+            ):
+                return Response(status=304, headers=headers)
+        if trace is not None:
+            body = dumps({**loads(body), 'timing': trace.to_dict()})
+    return Response(body, mimetype=JSON, headers=headers)
+
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """Search with many queries at once, see `parse_batch` for the body."""
+    body = request.get_json(silent=True)
+    try:
+        texts, limits = parse_batch(body)
+        fields = parse_fields(body.get("fields"))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    with deadline.budget(deadline.Deadline.for_batch(len(texts))) as budget:
+        results = searcher.search_many(texts, limits)
+    return Response(dumps({
+        'results': [
+            {'query': text, 'recommendations': [project(r, fields) for r in recs]}
+            for text, recs in zip(texts, results)
+        ],
+        'degraded': sorted(budget.degraded),
+    }), mimetype=JSON)
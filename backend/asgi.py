@@ -0,0 +1,274 @@
+"""
+ASGI App.
+
+This file contains the api served by `salesman web --workers N`. It has
+the same routes as the Flask app in `api.py`, but requests are searched
+on the event loop of each worker instead of holding a thread while they
+wait on Cohere, Qdrant and the translator.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from gunicorn.app.base import BaseApplication
+from starlette.routing import Match
+
+from . import deadline, metrics
+from .api import (
+    DEGRADED_HEADERS,
+    JSON,
+    NDJSON,
+    SSE,
+    STREAM_HEADERS,
+    authorized,
+    cache_headers,
+    etag,
+    ndjson_event,
+    negotiate,
+    not_modified,
+    parse_batch,
+    parse_limit,
+    reload_catalog,
+    response_key,
+    responses,
+    searcher,
+    sse_event,
+)
+from .config import ADMIN_TOKEN, UPSTREAM_WORKERS
+from .deadline import DeadlineExceeded
+from .encoding import dumps, encode_response, loads, parse_fields, project
+from .laptops.embed_laptops import CursorError
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # blocking upstream calls run in the loop's default executor, which
+    # only has a few threads per cpu
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(UPSTREAM_WORKERS, thread_name_prefix="upstream")
+    )
+    # every worker watches for a new catalog on its own
+    searcher.watch()
+    yield
+
+
+app = FastAPI(title="Salesman", lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
+)
+
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Record the latency, errors and in-flight count of each route."""
+    route = next(
+        (r.name for r in app.routes if r.matches(request.scope)[0] == Match.FULL),
+        None,
+    )
+    started = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.inc(route)
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.REQUEST_ERRORS.inc(route)
+        raise
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec(route)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+    if response.status_code >= 500:
+        metrics.REQUEST_ERRORS.inc(route)
+    return response
+
+
+def json_response(request: Request, body: bytes, headers=None) -> Response:
+    """Send a json body, compressed when the client accepts it."""
+    body, coding = encode_response(body, request.headers.get("Accept-Encoding"))
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    return Response(body, media_type=JSON, headers=headers)
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, error: DeadlineExceeded):
+    return JSONResponse({"error": str(error)}, status_code=504)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Expose the metrics in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post("/admin/reload")
+async def admin_reload(request: Request):
+    """Swap in a new snapshot of the catalog, see `api.admin_reload`."""
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    if not authorized(request.headers.get("Authorization")):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    return JSONResponse({"version": reload_catalog()}, status_code=202)
+
+
+@app.get("/search/{query}")
+async def search(
+    query: str,
+    request: Request,
+    limit: str = "5",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    debug: Optional[str] = None,
+):
+    """Search for laptops, one page at a time, see `api.search`."""
+    try:
+        limit = parse_limit(limit)
+        projection = parse_fields(fields)
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    mimetype = negotiate(request.headers.get("Accept"))
+    if mimetype not in (NDJSON, SSE):
+        return await search_json(
+            query, request, limit, cursor, projection, debug == "timing"
+        )
+    budget = deadline.Deadline()
+    try:
+        with deadline.budget(budget):
+            recommendations, lang, next_cursor = await searcher.arank_page(
+                query, limit=limit, cursor=cursor
+            )
+    except CursorError as error:
+        return JSONResponse({"error": str(error)}, status_code=410)
+    event = ndjson_event if mimetype == NDJSON else sse_event
+
+    async def events():
+        for laptop in recommendations:
+            yield event("recommendation", project(laptop, projection))
+        with deadline.budget(budget):
+            translations = searcher.atranslations(recommendations, lang)
+            async for category, _id, description in translations:
+                yield event("translation", {
+                    "category": category, "id": _id, "description": description
+                })
+        yield event("done", {
+            "next_cursor": next_cursor, "degraded": sorted(budget.degraded)
+        })
+
+    return StreamingResponse(events(), media_type=mimetype, headers=STREAM_HEADERS)
+
+
+async def search_json(
+    query: str,
+    request: Request,
+    limit: int,
+    cursor: Optional[str],
+    fields: Optional[tuple[str, ...]],
+    timing: bool,
+):
+    """Search for a page of laptops as json, the first pages are cached."""
+    with metrics.tracing(timing) as trace, deadline.budget() as budget:
+        if cursor is not None:
+            try:
+                recommendations, next_cursor = await searcher.asearch_page(
+                    query, limit=limit, cursor=cursor
+                )
+            except CursorError as error:
+                return JSONResponse({"error": str(error)}, status_code=410)
+            with metrics.stage("encode"):
+                page = {
+                    "recommendations": [project(r, fields) for r in recommendations],
+                    "next_cursor": next_cursor,
+                    "degraded": sorted(budget.degraded),
+                }
+                if trace is not None:
+                    page["timing"] = trace.to_dict()
+                body = dumps(page)
+            return json_response(request, body)
+        key = response_key(query, limit, fields)
+        body = responses.get(key)
+        metrics.record_cache("responses", body is not None, body is None)
+        if body is None:
+            recommendations, next_cursor = await searcher.asearch_page(query, limit)
+            with metrics.stage("encode"):
+                body = dumps({
+                    "recommendations": [project(r, fields) for r in recommendations],
+                    "next_cursor": next_cursor,
+                    "degraded": sorted(budget.degraded),
+                })
+            if not budget.degraded:
+                responses.set(key, body)
+        if budget.degraded:
+            headers = DEGRADED_HEADERS
+        else:
+            headers = cache_headers(etag(body))
+            if not timing and not_modified(
+                request.headers.get("If-None-Match"), headers["ETag"]
+            ):
+                return Response(status_code=304, headers=headers)
+        if trace is not None:
+            body = dumps({**loads(body), "timing": trace.to_dict()})
+    return json_response(request, body, headers)
+
+
+@app.post("/search/batch")
+async def search_batch(request: Request):
+    """Search with many queries at once, see `api.parse_batch` for the body."""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    try:
+        texts, limits = parse_batch(body)
+        fields = parse_fields(body.get("fields"))
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    with deadline.budget(deadline.Deadline.for_batch(len(texts))) as budget:
+        results = await searcher.asearch_many(texts, limits)
+    return json_response(request, dumps({
+        "results": [
+            {"query": text, "recommendations": [project(r, fields) for r in recs]}
+            for text, recs in zip(texts, results)
+        ],
+        "degraded": sorted(budget.degraded),
+    }))
+
+
+class Server(BaseApplication):
+    """A gunicorn server running the app in uvicorn workers."""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return app
+
+
+def serve(host: str = "127.0.0.1", port: int = 5000, workers: int = 1) -> None:
+    """
+    Serve the app.
+
+    The catalog and the indexes are loaded once before the workers are
+    forked, so their pages are shared.
+
+    Args:
+        host: the host to bind
+        port: the port to bind
+        workers: the number of worker processes
+    """
+    searcher.preload()
+    Server({
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+    }).run()
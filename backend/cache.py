@@ -0,0 +1,339 @@
+"""
+Caches.
+
+This file contains the caches used to avoid repeating upstream calls.
+A `MemoryCache` is a per-process LRU with size and age limits, a
+`DiskCache` is a sqlite backed cache that survives restarts and is shared
+by every worker on the machine, and a `TieredCache` puts the former in
+front of the latter. A `SingleFlight` shares calls that are still in
+flight, before their results can be cached.
+"""
+
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Hashable, Optional, Union
+
+MISSING = object()
+
+
+class MemoryCache:
+    """A thread-safe least-recently-used cache."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        """
+        Initialize a memory cache.
+
+        Args:
+            maxsize: the number of entries to keep
+            ttl: how long an entry lives in seconds, forever when `None`
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an entry, `default` is returned on a miss."""
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+            if entry is not MISSING:
+                expires, value = entry  # type: ignore
+                if expires >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Add an entry, evicting the least recently used ones.
+
+        Args:
+            key: the key of the entry
+            value: the value of the entry
+            ttl: how long this entry lives in seconds, capped by the ttl
+                of the cache. the ttl of the cache when `None`
+        """
+        if self.ttl:
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        expires = float("inf") if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove an entry."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        """Get the hit and miss counters of the cache."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+class DiskCache:
+    """A persistent cache stored in a sqlite table."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        table: str = "cache",
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        """
+        Initialize a disk cache.
+
+        Args:
+            path: the sqlite database to use, it's created when missing
+            table: the table that holds the entries
+            maxsize: the number of entries to keep, the oldest ones are
+                evicted first. unbounded when `None`
+            ttl: how long an entry lives in seconds, forever when `None`
+        """
+        self.path = Path(path)
+        self.table = table
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = self._connect()
+        # sqlite connections can't be used across a fork, forked workers
+        # open their own
+        after_fork = weakref.WeakMethod(self._after_fork)
+        os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value BLOB, created REAL)"
+            )
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_created ON {table}(created)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._db = self._connect()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get an entry, `default` is returned on a miss."""
+        return self.lookup(key, default)[0]
+
+    def lookup(self, key: str, default: Any = None) -> tuple[Any, Optional[float]]:
+        """
+        Get an entry and how long it has left to live.
+
+        Args:
+            key: the key of the entry
+            default: returned on a miss
+        Returns:
+            The entry, or `default`, and its remaining lifetime in
+            seconds, `None` when entries don't expire
+        """
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            remaining = None
+            if row is not None and self.ttl is not None:
+                remaining = row[1] + self.ttl - time.time()
+            if row is not None and (remaining is None or remaining >= 0):
+                self.hits += 1
+                return pickle.loads(row[0]), remaining
+            self.misses += 1
+            return default, None
+
+    def set(self, key: str, value: Any) -> None:
+        """Add an entry."""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)",
+                (key, blob, time.time()),
+            )
+            self._writes += 1
+            # trimming is amortized over many writes
+            if self._writes % 256 == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE created < ?",
+                (time.time() - self.ttl,),
+            )
+        if self.maxsize is not None:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM"
+                f" {self.table} ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def delete(self, key: str) -> None:
+        """Remove an entry."""
+        with self._lock, self._db:
+            self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock, self._db:
+            self._db.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> dict[str, int]:
+        """Get the hit and miss counters of the cache."""
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class TieredCache:
+    """A memory cache in front of an optional disk cache."""
+
+    def __init__(self, memory: MemoryCache, disk: Optional[DiskCache] = None):
+        """
+        Initialize a tiered cache.
+
+        Args:
+            memory: the first tier
+            disk: the second tier, entries found here are promoted to
+                the first tier for the rest of their lifetime
+        """
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get an entry, `default` is returned on a miss."""
+        value = self.memory.get(key, MISSING)
+        if value is MISSING and self.disk is not None:
+            value, remaining = self.disk.lookup(key, MISSING)
+            if value is not MISSING:
+                # a promoted entry must not outlive its disk copy, cached
+                # pages hold cursors that expire with it
+                self.memory.set(key, value, ttl=remaining)
+        return default if value is MISSING else value
+
+    def set(self, key: str, value: Any) -> None:
+        """Add an entry to every tier."""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def delete(self, key: str) -> None:
+        """Remove an entry from every tier."""
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        """Remove every entry from every tier."""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    @property
+    def hits(self) -> int:
+        return self.memory.hits + (self.disk.hits if self.disk else 0)
+
+    @property
+    def misses(self) -> int:
+        return self.disk.misses if self.disk else self.memory.misses
+
+    def stats(self) -> dict[str, Any]:
+        """Get the hit and miss counters of each tier."""
+        stats: dict[str, Any] = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory": self.memory.stats(),
+        }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+class SingleFlight:
+    """Share a coroutine's result between concurrent callers with the same key."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights: dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable]) -> Any:
+        """
+        Run a call, or wait for the same call that's already running.
+
+        Args:
+            key: identifies the call, calls with equal keys must have
+                equal results
+            call: makes the coroutine to run
+        Returns:
+            The result of the call, shared by every caller
+        """
+        # futures belong to an event loop
+        key = (asyncio.get_running_loop(), key)
+        future = self._flights.get(key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self._flights[key] = future
+            future.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        # a caller that's cancelled doesn't cancel the others
+        return await asyncio.shield(future)
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+def create_cache(
+    table: str,
+    maxsize: int,
+    ttl: Optional[float] = None,
+    path: Optional[Union[str, Path]] = None,
+    disk_maxsize: Optional[int] = None,
+) -> TieredCache:
+    """
+    Create a memory cache backed by a disk cache when `path` is set.
+
+    Args:
+        table: the table of the disk cache
+        maxsize: the number of entries kept in memory
+        ttl: how long an entry lives in seconds, forever when `None`
+        path: the sqlite database of the disk cache
+        disk_maxsize: the number of entries kept on disk
+    Returns:
+        The cache
+    """
+    disk = None
+    if path:
+        disk = DiskCache(path, table=table, maxsize=disk_maxsize, ttl=ttl)
+    return TieredCache(MemoryCache(maxsize=maxsize, ttl=ttl), disk)
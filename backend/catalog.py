@@ -0,0 +1,206 @@
+"""
+Catalog Version And Snapshots.
+
+This file contains the version of the catalog, a token stored in a file
+that changes every time the catalog, its embeddings or its indexes are
+rebuilt or uploaded. Caches include it in their keys, so a rebuild
+invalidates them in every running worker without a restart.
+
+It also contains the current snapshot of the catalog. Snapshots are never
+changed, a new one is loaded in the background when the files it's loaded
+from change and swapped in with a single assignment, so searches never
+take a lock or see a half loaded catalog.
+"""
+
+import logging
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Generic, Iterable, Optional, TypeVar, Union
+
+from . import metrics
+
+S = TypeVar("S")
+logger = logging.getLogger(__name__)
+
+
+class CatalogNotBuilt(Exception):
+    """Raised when a catalog is loaded before the files it needs are built."""
+
+
+class CatalogVersion:
+    """The version of the catalog, shared through a file."""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Initialize a catalog version.
+
+        Args:
+            path: the file that holds the version
+        """
+        self.path = Path(path)
+        self._stat: tuple[int, int] | None = None
+        self._version = "0"
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        """Get the version, the file is only read again when it changes."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return "0"
+        with self._lock:
+            if (stat.st_ino, stat.st_mtime_ns) != self._stat:
+                self._version = self.path.read_text().strip() or "0"
+                self._stat = (stat.st_ino, stat.st_mtime_ns)
+            return self._version
+
+    def bump(self) -> str:
+        """Change the version."""
+        version = secrets.token_hex(8)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(version)
+        tmp.replace(self.path)
+        return version
+
+
+class Catalog(Generic[S]):
+    """The current snapshot of a catalog."""
+
+    def __init__(
+        self,
+        load: Callable[[], S],
+        paths: Iterable[Union[str, Path]],
+        warm: Optional[Callable[[S], Any]] = None,
+    ):
+        """
+        Initialize a catalog, the first snapshot is loaded on first use.
+
+        Args:
+            load: loads a snapshot
+            paths: the files a snapshot is loaded from, a snapshot is
+                reloaded when one of them changes
+            warm: loads what a snapshot otherwise loads on first use, it's
+                called on new snapshots before they are swapped in
+        """
+        self._load = load
+        self._warm = warm
+        self.paths = tuple(Path(path) for path in paths)
+        self._snapshot: Optional[S] = None
+        self._stamp: Optional[tuple] = None
+        # why the first snapshot failed to load from the files at `_stamp`
+        self._error: Optional[Exception] = None
+        # only serializes loads, reading the snapshot takes no lock
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    def stamp(self) -> tuple:
+        """Identify the current state of the files of the catalog."""
+        stamps = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    @property
+    def snapshot(self) -> S:
+        """
+        The current snapshot, it's the same object for a whole search.
+
+        Raises:
+            CatalogNotBuilt: when the files of the catalog aren't built
+            Exception: when the first snapshot fails to load, it's only
+                loaded again once the files change
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    stamp = self.stamp()
+                    if self._error is not None and stamp == self._stamp:
+                        raise self._error.with_traceback(None)
+                    self._stamp = stamp
+                    try:
+                        self._snapshot = self._load()
+                    except CatalogNotBuilt as error:
+                        logger.warning("%s", error)
+                        self._error = error
+                        raise
+                    except Exception as error:
+                        logger.exception("loading the catalog failed")
+                        self._error = error
+                        raise
+                    self._error = None
+                snapshot = self._snapshot
+        return snapshot
+
+    def changed(self) -> bool:
+        """Check whether the files changed since the snapshot was loaded."""
+        return self._stamp is not None and self.stamp() != self._stamp
+
+    def reload(self) -> S:
+        """
+        Load a new snapshot and swap it in.
+
+        Searches that started before keep the snapshot they started with.
+
+        Returns:
+            The new snapshot
+        """
+        with self._lock:
+            # files changed while loading are picked up by the next reload
+            stamp = self.stamp()
+            try:
+                snapshot = self._load()
+                if self._warm is not None:
+                    self._warm(snapshot)
+            except Exception:
+                metrics.CATALOG_RELOADS.inc("failed")
+                # the same files aren't tried again until they change
+                self._stamp = stamp
+                raise
+            self._snapshot, self._stamp = snapshot, stamp
+        metrics.CATALOG_RELOADS.inc("ok")
+        return snapshot
+
+    def reload_in_background(self) -> threading.Thread:
+        """Reload in a new thread, see `reload`."""
+        thread = threading.Thread(
+            target=self._try_reload, name="catalog-reload", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _try_reload(self) -> None:
+        try:
+            self.reload()
+        except CatalogNotBuilt as error:
+            logger.warning("%s", error)
+        except Exception:
+            logger.exception("reloading the catalog failed, keeping the old one")
+
+    def watch(self, interval: float) -> None:
+        """
+        Reload in a background thread whenever the files change.
+
+        Args:
+            interval: seconds between checks, 0 disables watching
+        """
+        # a watcher started before a fork doesn't run in the child
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                if self.changed():
+                    self._try_reload()
+
+        self._watcher = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
@@ -0,0 +1,174 @@
+"""
+Search Categories.
+
+This file contains the categories of gadgets that are searched, each with
+its own database, indexes and Qdrant collection, and how the rankings of
+several categories are merged into one. Queries are embedded once and
+every category is searched with the same vectors at the same time, so a
+query like "cheap device for a student" costs a single round trip.
+
+Rankings are merged by score: a multilingual embedding scores gadgets of
+every category on the same scale. Each category searched is guaranteed a
+share of the page, see `CATEGORY_QUOTAS`, so one category scoring a little
+higher doesn't hide the others.
+"""
+
+import heapq
+import re
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Sequence
+
+from .config import (
+    LAPTOP_ANN_INDEX,
+    LAPTOP_DB,
+    LAPTOP_LEXICAL_INDEX,
+    LAPTOP_QUANTIZED_VECTORS,
+    LAPTOP_STORE,
+    LAPTOP_VECTORS,
+    LAPTOPS_COLLECTION_NAME,
+    PHONE_ANN_INDEX,
+    PHONE_DB,
+    PHONE_LEXICAL_INDEX,
+    PHONE_QUANTIZED_VECTORS,
+    PHONE_STORE,
+    PHONE_VECTORS,
+    PHONES_COLLECTION_NAME,
+    TRANSLATIONS_DIR,
+)
+from .query_parser import laptop_fields, phone_fields
+from .vector_index import Hit
+
+
+class Category(NamedTuple):
+    """A category of gadgets and the files it's searched with."""
+
+    name: str
+    # what a single gadget is called in the texts that are embedded
+    noun: str
+    collection_name: str
+    db: Path
+    store: Path
+    vectors: Path
+    lexical: Path
+    ann_index: Path
+    quantized: Path
+    # words naming the category in the languages queries come in
+    keywords: re.Pattern
+    # the normalized fields constraints are matched to, see `query_parser.py`
+    fields: Callable[[dict], dict[str, Any]]
+
+    def translations(self, lang: str) -> Path:
+        """The store of the descriptions translated to a language ahead of time."""
+        return TRANSLATIONS_DIR.joinpath(f"{self.name}.{lang}.store")
+
+    def translation_journal(self, lang: str) -> Path:
+        """The translations made since the store was last compacted."""
+        return TRANSLATIONS_DIR.joinpath(f"{self.name}.{lang}.jsonl")
+
+
+LAPTOPS = Category(
+    name="laptops",
+    noun="laptop",
+    collection_name=LAPTOPS_COLLECTION_NAME,
+    db=LAPTOP_DB,
+    store=LAPTOP_STORE,
+    vectors=LAPTOP_VECTORS,
+    lexical=LAPTOP_LEXICAL_INDEX,
+    ann_index=LAPTOP_ANN_INDEX,
+    quantized=LAPTOP_QUANTIZED_VECTORS,
+    keywords=re.compile(
+        r"\b(?:laptops?|notebooks?|ultrabooks?|macbooks?|ordinateurs? portables?"
+        r"|port[aá]til(?:es)?|computadoras? port[aá]til(?:es)?)\b"
+    ),
+    fields=laptop_fields,
+)
+PHONES = Category(
+    name="phones",
+    noun="phone",
+    collection_name=PHONES_COLLECTION_NAME,
+    db=PHONE_DB,
+    store=PHONE_STORE,
+    vectors=PHONE_VECTORS,
+    lexical=PHONE_LEXICAL_INDEX,
+    ann_index=PHONE_ANN_INDEX,
+    quantized=PHONE_QUANTIZED_VECTORS,
+    keywords=re.compile(
+        r"\b(?:(?:smart|cell|mobile )?phones?|iphones?|t[ée]l[ée]phones?"
+        r"|tel[ée]fonos?|m[óo]vil(?:es)?|celular(?:es)?|handys?)\b"
+    ),
+    fields=phone_fields,
+)
+CATEGORIES = {category.name: category for category in (LAPTOPS, PHONES)}
+
+
+def get_category(name: str) -> Category:
+    """
+    Get a category by its name.
+
+    Raises:
+        ValueError: when there is no such category
+    """
+    try:
+        return CATEGORIES[name]
+    except KeyError:
+        raise ValueError(f"unknown category: {name!r}") from None
+
+
+def mentioned_categories(text: str, names: Sequence[str]) -> list[str]:
+    """
+    Find the categories a query asks for by name.
+
+    Args:
+        text: the query
+        names: the categories that can be searched
+    Returns:
+        The categories named in the query, every category when it names
+        none
+    """
+    text = text.casefold()
+    found = [name for name in names if CATEGORIES[name].keywords.search(text)]
+    return found or list(names)
+
+
+def merge_by_score(
+    rankings: dict[str, Sequence[Hit]], limit: int, quotas: dict[str, float]
+) -> list[tuple[str, Hit]]:
+    """
+    Merge the rankings of several categories.
+
+    Each category is first given its quota of the page, as many of its best
+    hits as `quotas[name] * limit` rounded down, the rest of the page goes
+    to the best remaining hits of any category.
+
+    Args:
+        rankings: the hits of each category, best first, scores that can
+            be compared between categories
+        limit: the number of results
+        quotas: the least share of the results of each category
+    Returns:
+        The category and hit of each result, best first
+    """
+    if len(rankings) == 1:
+        [(name, hits)] = rankings.items()
+        return [(name, hit) for hit in hits[:limit]]
+    reserved = {
+        name: min(len(hits), int(quotas.get(name, 0) * limit))
+        for name, hits in rankings.items()
+    }
+    # on a page too short for every quota, the last categories give way
+    while sum(reserved.values()) > limit:
+        name = next(name for name in reversed(rankings) if reserved[name])
+        reserved[name] -= 1
+    selected = [
+        (name, hit) for name, hits in rankings.items() for hit in hits[: reserved[name]]
+    ]
+    rest = heapq.merge(
+        *(
+            [(name, hit) for hit in hits[reserved[name] :]]
+            for name, hits in rankings.items()
+        ),
+        key=lambda result: -result[1].score,
+    )
+    selected += islice(rest, limit - len(selected))
+    return sorted(selected, key=lambda result: -result[1].score)
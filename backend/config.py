@@ -1,26 +1,132 @@
 """Application Configurations."""
 
+import os
 from pathlib import Path
 
 BASEDIR = Path(__file__).parent.parent
 
 BACKEND = BASEDIR.joinpath("backend")
-DATABASE = BACKEND.joinpath("database")
+DATABASE = Path(os.environ.get("SALESMAN_DATABASE", BACKEND.joinpath("database")))
 
 PHONE_DB = DATABASE.joinpath("phones_raw.json")
 PHONE_SCHEMA = BACKEND.joinpath("schemas", "phones.json")
+PHONE_VECTORS = DATABASE.joinpath("phone_embeddings.npy")
+PHONE_STORE = DATABASE.joinpath("phones.store")
+PHONE_LEXICAL_INDEX = DATABASE.joinpath("phones.lexical")
+PHONE_ANN_INDEX = DATABASE.joinpath("phone_embeddings.ivf")
+PHONE_QUANTIZED_VECTORS = DATABASE.joinpath("phone_embeddings.quantized")
+PHONES_COLLECTION_NAME = "phones"
 
 LAPTOP_DB = DATABASE.joinpath("laptops_raw.json")
 LAPTOP_SCHEMA = BACKEND.joinpath("schemas", "laptop.json")
 LAPTOP_VECTORS = DATABASE.joinpath("laptop_embeddings.npy")
+LAPTOP_STORE = DATABASE.joinpath("laptops.store")
+LAPTOP_LEXICAL_INDEX = DATABASE.joinpath("laptops.lexical")
+LAPTOP_ANN_INDEX = DATABASE.joinpath("laptop_embeddings.ivf")
+LAPTOP_QUANTIZED_VECTORS = DATABASE.joinpath("laptop_embeddings.quantized")
 LAPTOP_PAYLOADS = [
     DATABASE.joinpath(f"laptops_classified_by_specs.json"),
     DATABASE.joinpath(f"laptops_classified_by_groups.json"),
 ]
 LAPTOPS_COLLECTION_NAME = "laptops"
+# changes whenever the catalog is rebuilt or uploaded, see `catalog.py`
+CATALOG_VERSION = DATABASE.joinpath("catalog_version")
+# seconds between checks for a new catalog by a running server, 0 disables
+# reloading it without a restart
+CATALOG_WATCH_INTERVAL = float(os.environ.get("SALESMAN_CATALOG_WATCH_INTERVAL", 5))
+# the bearer token of `POST /admin/reload`, which is disabled without one
+ADMIN_TOKEN = os.environ.get("SALESMAN_ADMIN_TOKEN")
 
+EMBEDDING_MODEL = "multilingual-22-12"
+# the most texts the embedding model accepts in one call
+EMBED_BATCH_SIZE = 96
+# query embeddings are cached in memory and, when a path is set, on disk
+EMBEDDING_CACHE_SIZE = 10_000
+EMBEDDING_CACHE_TTL = 30 * 24 * 60 * 60
+EMBEDDING_CACHE_DB = DATABASE.joinpath("embeddings.sqlite")
+EMBEDDING_CACHE_DB_SIZE = 1_000_000
+
+# translated descriptions are cached in memory and, when a path is set, on disk
+TRANSLATION_CACHE_SIZE = 5_000
+TRANSLATION_CACHE_TTL = 90 * 24 * 60 * 60
+TRANSLATION_CACHE_DB = DATABASE.joinpath("translations.sqlite")
+TRANSLATION_CACHE_DB_SIZE = 500_000
+# the number of chunks translated at the same time
+TRANSLATION_WORKERS = 16
+# descriptions translated ahead of time by `salesman build --languages`,
+# a store per category and language
+TRANSLATIONS_DIR = DATABASE.joinpath("translations")
+# the number of descriptions translated at the same time when building
+PRETRANSLATION_WORKERS = int(os.environ.get("SALESMAN_PRETRANSLATION_WORKERS", 8))
+
+
+# where vectors are searched: "qdrant", or in process with "exact" for
+# LAPTOP_VECTORS, "ivf" for LAPTOP_ANN_INDEX or "quantized" for
+# LAPTOP_QUANTIZED_VECTORS
+SEARCH_BACKEND = os.environ.get("SALESMAN_SEARCH_BACKEND", "qdrant")
+# the number of lists of LAPTOP_ANN_INDEX searched for each query
+ANN_PROBES = int(os.environ.get("SALESMAN_ANN_PROBES", 8))
+# candidates per result of a quantized search rescored with LAPTOP_VECTORS,
+# 0 disables rescoring
+QUANTIZED_RESCORE = int(os.environ.get("SALESMAN_QUANTIZED_RESCORE", 4))
+
+# prices in euros found in queries are converted to dollars, the currency
+# of catalog prices
+USD_PER_EUR = float(os.environ.get("SALESMAN_USD_PER_EUR", 1.08))
+
+# the categories searched together, see `categories.py`. a category whose
+# database is missing, or that isn't built, is skipped
+SEARCH_CATEGORIES = os.environ.get("SALESMAN_SEARCH_CATEGORIES", "laptops,phones").split(",")
+# the least share of a page given to each category searched, when it has
+# enough results. the rest of the page goes to the best results of any
+# category
+CATEGORY_QUOTAS = {"laptops": 0.2, "phones": 0.2}
 
 QDRANT_BATCH_SIZE = 256
+SEARCH_BATCH_MAX_QUERIES = 1000
+
+# pagination, the first page ranks a window of results that later pages
+# are served from
+SEARCH_WINDOW_SIZE = 50
+SEARCH_CURSOR_TTL = 10 * 60
+# the most results a page, or a query of a batch, may ask for
+SEARCH_MAX_LIMIT = SEARCH_WINDOW_SIZE
+SEARCH_CURSOR_CACHE_SIZE = 10_000
+# cursors are shared on disk by the workers of `salesman web --workers N`
+SEARCH_CURSOR_DB = DATABASE.joinpath("cursors.sqlite")
+
+# json search responses, keyed by the catalog version. they are dropped
+# before the cursors they contain expire
+RESPONSE_CACHE_SIZE = 10_000
+RESPONSE_CACHE_TTL = SEARCH_CURSOR_TTL // 2
+RESPONSE_CACHE_DB = DATABASE.joinpath("responses.sqlite")
+# the fields of a recommendation sent when a search doesn't ask for others
+# with `fields=`, see `encoding.py`. "full" sends whole records
+FIELD_PROFILES = {
+    "slim": (
+        "id", "category", "name", "mpn", "info",
+        "description", "target_user", "prices", "images",
+    ),
+}
+DEFAULT_FIELDS = os.environ.get("SALESMAN_DEFAULT_FIELDS", "slim")
+# smaller responses aren't worth compressing
+COMPRESSION_MIN_SIZE = 1024
+# fast levels, a response is compressed on every request
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+# threads available for blocking calls to upstream services
+UPSTREAM_WORKERS = 64
+# seconds a search request may take, stages that would take longer are
+# degraded, see `deadline.py`
+SEARCH_DEADLINE = float(os.environ.get("SALESMAN_SEARCH_DEADLINE", 2.5))
+# the most seconds each stage may take of what is left of the deadline,
+# embedding and detecting the language run at the same time and
+# translating takes the rest
+STAGE_DEADLINES = {
+    "embed": 1.0,
+    "detect_language": 0.5,
+    "vector_search": 0.5,
+}
 QDRANT_HOST = (
     "https://9e14e244-10a1-4914-865e-cff41e27beb0.us-east-1-0.aws.cloud.qdrant.io:6333"
 )
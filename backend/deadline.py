@@ -0,0 +1,174 @@
+"""
+Search Deadlines.
+
+This file contains the latency budget of a request. Each stage that waits
+on an upstream service may use what is left of the budget, up to its own
+share in `STAGE_DEADLINES`, and a stage that misses its deadline degrades
+instead of holding the request: the language is assumed, Qdrant is
+replaced by a local search, results are left untranslated. The stages
+that degraded are kept with the budget so the response can flag them.
+
+The budget is held in a context variable, like a trace of `metrics`, so
+it follows the request into the searcher's tasks. Without a budget,
+stages wait as long as they need.
+"""
+
+import asyncio
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Hashable, Optional, TypeVar
+
+from . import metrics
+from .cache import SingleFlight
+from .config import EMBED_BATCH_SIZE, SEARCH_DEADLINE, STAGE_DEADLINES
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage misses its deadline and can't degrade."""
+
+
+class Deadline:
+    """The latency budget of a request."""
+
+    def __init__(
+        self,
+        seconds: float = SEARCH_DEADLINE,
+        stages: Optional[dict[str, float]] = None,
+    ):
+        """
+        Initialize a deadline.
+
+        Args:
+            seconds: how long the request may take
+            stages: the most seconds each stage may take,
+                `STAGE_DEADLINES` by default
+        """
+        self.expires = time.monotonic() + seconds
+        self.stages = STAGE_DEADLINES if stages is None else stages
+        self.degraded: set[str] = set()
+
+    @classmethod
+    def for_batch(cls, queries: int) -> "Deadline":
+        """
+        Get the deadline of a batch of queries.
+
+        Queries are embedded `EMBED_BATCH_SIZE` at a time, one call after
+        the other, so the budget and the share of every stage grow with
+        the number of calls.
+
+        Args:
+            queries: the number of queries of the batch
+        """
+        calls = max(1, math.ceil(queries / EMBED_BATCH_SIZE))
+        return cls(
+            SEARCH_DEADLINE * calls,
+            {stage: seconds * calls for stage, seconds in STAGE_DEADLINES.items()},
+        )
+
+    def remaining(self) -> float:
+        """Get the seconds left before the deadline."""
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def timeout(self, stage: str) -> float:
+        """Get the seconds a stage may take."""
+        return min(self.stages.get(stage, float("inf")), self.remaining())
+
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def budget(deadline: Deadline | float | None = None):
+    """
+    Give the current request a latency budget.
+
+    Args:
+        deadline: a deadline, or the seconds the request may take,
+            `SEARCH_DEADLINE` by default
+    Yields:
+        The deadline
+    """
+    if not isinstance(deadline, Deadline):
+        deadline = Deadline(SEARCH_DEADLINE if deadline is None else deadline)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Get the deadline of the current request, `None` when it has none."""
+    return _deadline.get()
+
+
+def degrade(stage: str) -> None:
+    """Record that a stage degraded to meet the deadline."""
+    metrics.DEGRADED.inc(stage)
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.degraded.add(stage)
+
+
+def inherit(stages) -> None:
+    """Flag stages that degraded for an earlier or a shared request."""
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.degraded.update(stages)
+
+
+async def wait(stage: str, awaitable: Awaitable[T]) -> T:
+    """
+    Wait for a stage until its deadline.
+
+    Args:
+        stage: the name of the stage, see `STAGE_DEADLINES`
+        awaitable: the work of the stage, it's cancelled when it's late
+    Returns:
+        The result of the stage
+    Raises:
+        DeadlineExceeded: when the stage misses its deadline
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, deadline.timeout(stage))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{stage} missed its deadline") from None
+
+
+async def coalesce(
+    flights: SingleFlight, key: Hashable, call: Callable[[], Awaitable[T]]
+) -> T:
+    """
+    Run a call through a `SingleFlight`, flagging what it degraded.
+
+    The call runs with the deadline of the first caller, every caller
+    gets the stages it degraded.
+
+    Args:
+        flights: the calls in flight
+        key: identifies identical calls
+        call: makes the awaitable of the call
+    Returns:
+        The result of the call
+    """
+
+    async def degradable():
+        parent = _deadline.get()
+        if parent is None:
+            return await call(), frozenset()
+        deadline = Deadline(stages=parent.stages)
+        deadline.expires = parent.expires
+        with budget(deadline):
+            result = await call()
+        return result, frozenset(deadline.degraded)
+
+    result, degraded = await flights.run(key, degradable)
+    inherit(degraded)
+    return result
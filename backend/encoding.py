@@ -0,0 +1,161 @@
+"""
+Response Encoding.
+
+This file contains how search responses are put on the wire. A raw
+laptop record carries its whole spec tree and every price, most of which
+is never shown, so recommendations are projected to the fields a client
+asks for with `fields=`, or to a slim profile by default. Responses are
+encoded with orjson and compressed with brotli or gzip, as negotiated
+with `Accept-Encoding`. Both are installed with the app, the json module
+and gzip stand in for them when they aren't.
+"""
+
+import gzip
+import json
+from typing import Any, Iterable, Optional
+
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from .config import (
+    BROTLI_QUALITY,
+    COMPRESSION_MIN_SIZE,
+    DEFAULT_FIELDS,
+    FIELD_PROFILES,
+    GZIP_LEVEL,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# the codings a response can be compressed with, preferred first
+CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value as compact json."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(body: bytes | str) -> Any:
+    """Decode json."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def parse_fields(value: Optional[str | Iterable[str]]) -> Optional[tuple[str, ...]]:
+    """
+    Parse the fields a client asks for.
+
+    Args:
+        value: field names separated by commas, or a list of them, `None`
+            for `DEFAULT_FIELDS`. A name is a key of a record, a path of
+            keys into it like `data.general.brand`, or a profile of
+            `FIELD_PROFILES`. "full" asks for whole records
+    Returns:
+        The fields, `None` for whole records
+    Raises:
+        ValueError: when no field is given or a field isn't a string
+    """
+    if value is None:
+        value = DEFAULT_FIELDS
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)) or not all(
+        isinstance(name, str) for name in value
+    ):
+        raise ValueError(f"invalid fields: {value!r}")
+    fields: dict[str, None] = {}
+    for name in (name.strip() for name in value):
+        if name == "full":
+            return None
+        fields.update(dict.fromkeys(FIELD_PROFILES.get(name, (name,) if name else ())))
+    if not fields:
+        raise ValueError("expected at least one field")
+    return tuple(fields)
+
+
+def project(record: dict, fields: Optional[tuple[str, ...]]) -> dict:
+    """
+    Keep the fields of a record, see `parse_fields`.
+
+    Fields the record doesn't have are left out, along with the parents
+    of a missing nested field:
+
+    >>> laptop = {"name": "XPS 13", "data": {"general": {"brand": "Dell"}}}
+    >>> project(laptop, ("name", "data.general.brand", "data.battery.hours"))
+    {'name': 'XPS 13', 'data': {'general': {'brand': 'Dell'}}}
+    >>> project(laptop, ("data.battery.hours",))
+    {}
+
+    Args:
+        record: the record
+        fields: the fields to keep, `None` to keep them all
+    Returns:
+        The projected record
+    """
+    if fields is None:
+        return record
+    projected: dict = {}
+    for field in fields:
+        *parents, key = field.split(".")
+        source = record
+        for parent in parents:
+            source = source.get(parent) if isinstance(source, dict) else None
+        if not isinstance(source, dict) or key not in source:
+            continue
+        target = projected
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = source[key]
+    return projected
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Choose how to compress a response from an `Accept-Encoding` header.
+
+    Returns:
+        "br", "gzip" or `None` to send it as is
+    """
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding, Accept).best_match(CODINGS)
+
+
+def compress(body: bytes, coding: Optional[str]) -> bytes:
+    """Compress a body with a coding from `negotiate_encoding`."""
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def encode_response(
+    body: bytes, accept_encoding: Optional[str]
+) -> tuple[bytes, Optional[str]]:
+    """
+    Compress a response body when the client accepts it and it's worth it.
+
+    Responses vary with `Accept-Encoding` either way.
+
+    Args:
+        body: the body
+        accept_encoding: the `Accept-Encoding` header of the request
+    Returns:
+        The body and its `Content-Encoding`, `None` when it's sent as is
+    """
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return body, None
+    coding = negotiate_encoding(accept_encoding)
+    return compress(body, coding), coding
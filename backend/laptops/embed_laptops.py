@@ -1,118 +1,469 @@
+import asyncio
+import contextvars
+import hashlib
 import json
+import logging
 import os
+import secrets
 import sys
+import threading
 import time
+import unicodedata
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import cache, cached_property
+from typing import TYPE_CHECKING, Iterable
 
 import numpy as np
 import rich
-from cohere import Client as CohereClient
-from qdrant_client import QdrantClient
-from qdrant_client.http.exceptions import UnexpectedResponse
-from qdrant_client.models import Distance, VectorParams
 from rich import box, get_console
 from rich.panel import Panel
 from rich.progress import Progress
 
 from ..config import (
+    ANN_PROBES,
+    CATALOG_VERSION,
+    CATEGORY_QUOTAS,
+    CATALOG_WATCH_INTERVAL,
     COHERE_API_KEY,
-    LAPTOP_DB,
-    LAPTOP_PAYLOADS,
-    LAPTOP_VECTORS,
-    LAPTOPS_COLLECTION_NAME,
+    EMBED_BATCH_SIZE,
+    EMBEDDING_CACHE_DB,
+    EMBEDDING_CACHE_DB_SIZE,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_TTL,
+    EMBEDDING_MODEL,
+    PRETRANSLATION_WORKERS,
     QDRANT_BATCH_SIZE,
     QDRANT_INIT_KWARGS,
+    QUANTIZED_RESCORE,
+    SEARCH_BACKEND,
+    SEARCH_CATEGORIES,
+    SEARCH_CURSOR_CACHE_SIZE,
+    SEARCH_CURSOR_DB,
+    SEARCH_CURSOR_TTL,
+    SEARCH_WINDOW_SIZE,
+    UPSTREAM_WORKERS,
 )
-from translate import Translator
+from .. import deadline, metrics
+from ..cache import SingleFlight, create_cache
+from ..catalog import Catalog, CatalogNotBuilt, CatalogVersion
+from ..categories import (
+    LAPTOPS,
+    Category,
+    get_category,
+    mentioned_categories,
+    merge_by_score,
+)
+from ..deadline import DeadlineExceeded
+from ..lexical import LexicalIndex, reciprocal_rank_fusion
+from ..payload_store import MemoryStore, PayloadStore, PayloadStoreError
+from ..query_parser import FIELDS, Constraints, FieldTable, parse_query
+from ..translation import DescriptionTranslator, digest, pretranslated, read_journal
+from ..vector_index import ExactIndex, Hit, IVFIndex, QuantizedIndex, recall
 
+if TYPE_CHECKING:
+    from cohere import Client as CohereClient
+    from qdrant_client import AsyncQdrantClient, QdrantClient
 
-cohere = CohereClient(COHERE_API_KEY)
-qdrant = QdrantClient(**QDRANT_INIT_KWARGS)
 console = get_console()
+logger = logging.getLogger(__name__)
+catalog_version = CatalogVersion(CATALOG_VERSION)
+# a gadget is found by its category and its id, ids of different
+# categories may be the same
+Key = tuple[str, int]
+
+
+@cache
+def get_cohere() -> "CohereClient":
+    """Get the Cohere client of the process, it's created on first use."""
+    from cohere import Client as CohereClient
+
+    return CohereClient(COHERE_API_KEY)
+
 
+@cache
+def get_qdrant() -> "QdrantClient":
+    """Get the Qdrant client of the process, it's created on first use."""
+    from qdrant_client import QdrantClient
 
-def embed_laptops() -> None:
-    """Embed all laptop classifications."""
+    return QdrantClient(**QDRANT_INIT_KWARGS)
+
+
+def embed_laptops(category: Category = LAPTOPS) -> None:
+    """Embed all laptop classifications, or the gadgets of another category."""
+    cohere = get_cohere()
     payloads: list[list[str]] = []
     embeddings: list[list[float]] = []
-    data: list[dict] = json.loads(LAPTOP_DB.read_text())
+    data: list[dict] = json.loads(category.db.read_text())
 
     for laptop in data[:]:
         _payloads = []
         for datapoint in ("name", "mpn", "info", "description"):
-            _payloads.append(laptop[datapoint])
+            # crawled phones aren't described
+            _payloads.append(laptop.get(datapoint) or "")
         _payloads.append(
-                classify_laptop_price(laptop["prices"]))
+                classify_laptop_price(laptop["prices"], category.noun))
         payloads.append(" ".join(_payloads))
 
     batch_counter = 1
     payload_size = len(payloads)
-    no_of_batches, r = divmod(payload_size, 96)
+    no_of_batches, r = divmod(payload_size, EMBED_BATCH_SIZE)
     if r != 0:
         no_of_batches += 1
     batch: list = []
     for payload in payloads:
         batch.append(payload)
-        if len(batch) >= 96:
+        if len(batch) >= EMBED_BATCH_SIZE:
             console.log(f"Embedding batch {batch_counter} of {no_of_batches}...")
-            resp = cohere.embed(batch, model="multilingual-22-12")
+            resp = cohere.embed(batch, model=EMBEDDING_MODEL)
             embeddings.append(resp.embeddings)
             batch_counter += 1
             batch = []
     if len(batch) > 0:
         console.log(f"Embedding batch {batch_counter} of {no_of_batches}...")
-        resp = cohere.embed(batch, model="multilingual-22-12")
+        resp = cohere.embed(batch, model=EMBEDDING_MODEL)
         embeddings.append(resp.embeddings)
         batch_counter += 1
         batch = []
     vectors = np.concatenate(embeddings)
     console.log("saving embeddings...")
-    np.save(LAPTOP_VECTORS, vectors)
+    np.save(category.vectors, vectors)
+    catalog_version.bump()
     console.log("done embedding ✔")
 
 
-def upload_to_cluster():
+def upload_to_cluster(category: Category = LAPTOPS):
     """Upload embeddings to a qdrants cluster."""
+    from qdrant_client.models import Distance, PayloadSchemaType, VectorParams
+
+    qdrant = get_qdrant()
+    collection_name = category.collection_name
     # load laptops data
     console.log("Loading data...")
-    data = json.loads(LAPTOP_DB.read_text())
+    data = json.loads(category.db.read_text())
     # load embeddings
     console.log("Loading embeddings...")
-    vectors = np.load(LAPTOP_VECTORS)
+    vectors = np.load(category.vectors)
     # get length of embeddings
     vector_size = len(vectors[0])
 
     # create collection.
     # NOTE: would be recreated if it exists.
-    console.log(f"Creating collection {LAPTOPS_COLLECTION_NAME!r}...")
+    console.log(f"Creating collection {collection_name!r}...")
     qdrant.recreate_collection(
-        collection_name=LAPTOPS_COLLECTION_NAME,
+        collection_name=collection_name,
         vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
     )
+    # index the normalized fields queries are filtered by
+    for field_name in category.fields({}):
+        field_schema = FIELDS[field_name]
+        qdrant.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=PayloadSchemaType(field_schema),
+        )
 
     # upload collection
-    console.log(f"Uploading collection {LAPTOPS_COLLECTION_NAME!r}...")
+    console.log(f"Uploading collection {collection_name!r}...")
     qdrant.upload_collection(
-        collection_name=LAPTOPS_COLLECTION_NAME,
+        collection_name=collection_name,
         vectors=vectors,
-        payload=data,
+        payload=[{**laptop, **category.fields(laptop)} for laptop in data],
         ids=[laptop["id"] for laptop in data],
         batch_size=QDRANT_BATCH_SIZE,
         parallel=10,
     )
+    catalog_version.bump()
+    console.log("Done ✔")
+
+
+def build_payload_store(category: Category = LAPTOPS) -> PayloadStore:
+    """Serialize all laptops, or phones, into a memory-mapped payload store."""
+    console.log("Loading data...")
+    data: list[dict] = json.loads(category.db.read_text())
+    console.log(f"Writing {len(data)} {category.name} to {category.store}...")
+    store = PayloadStore.build(data, category.store)
+    catalog_version.bump()
+    console.log("Done ✔")
+    return store
+
+
+def build_lexical_index(category: Category = LAPTOPS) -> LexicalIndex:
+    """Build the lexical index of the laptops' (or phones') names, MPNs and info."""
+    console.log("Loading data...")
+    data: list[dict] = json.loads(category.db.read_text())
+    console.log(f"Indexing {len(data)} {category.name}...")
+    index = LexicalIndex.build(data)
+    index.save(category.lexical)
+    catalog_version.bump()
+    console.log(f"Saved {len(index.postings)} terms to {category.lexical}")
+    return index
+
+
+def build_translations(
+    languages: Iterable[str],
+    category: Category = LAPTOPS,
+    workers: int = PRETRANSLATION_WORKERS,
+) -> None:
+    """
+    Translate the descriptions of all laptops, or phones, ahead of time.
+
+    Descriptions are translated concurrently and each translation is
+    appended to a journal as soon as it's made, so an interrupted build
+    resumes where it stopped. The translations of every language are then
+    compacted into a payload store, which the searcher reads instead of
+    calling the translator. Descriptions translated by an earlier build
+    are only translated again when they changed.
+
+    Args:
+        languages: the codes of the languages to translate to
+        category: the category of the descriptions
+        workers: the number of descriptions translated at the same time
+    """
+    console.log("Loading data...")
+    data: list[dict] = json.loads(category.db.read_text())
+    # crawled phones aren't described
+    descriptions = {
+        gadget["id"]: gadget["description"]
+        for gadget in data
+        if gadget.get("description")
+    }
+    digests = {_id: digest(text) for _id, text in descriptions.items()}
+    translator = DescriptionTranslator()
+    for lang in languages:
+        store, journal = category.translations(lang), category.translation_journal(lang)
+        store.parent.mkdir(parents=True, exist_ok=True)
+        done: dict[int, dict] = {}
+        try:
+            done.update(PayloadStore(store))
+        except PayloadStoreError:
+            pass
+        done.update(read_journal(journal))
+        pending = [
+            _id
+            for _id in descriptions
+            if _id not in done or done[_id]["digest"] != digests[_id]
+        ]
+        console.log(
+            f"Translating {len(pending)} of {len(descriptions)}"
+            f" {category.name} descriptions to {lang!r}..."
+        )
+        failed = 0
+        executor = ThreadPoolExecutor(workers, thread_name_prefix="pretranslate")
+        try:
+            futures = {
+                executor.submit(translator.translate, _id, descriptions[_id], lang): _id
+                for _id in pending
+            }
+            with open(journal, "a", encoding="utf-8") as file, Progress(
+                console=console, transient=True
+            ) as progress:
+                task = progress.add_task(f"Translating to {lang!r}", total=len(pending))
+                for future in as_completed(futures):
+                    _id = futures[future]
+                    progress.advance(task)
+                    try:
+                        description = future.result()
+                    except Exception as exc:
+                        # left for the next build to retry
+                        failed += 1
+                        console.log(f"Failed to translate {category.noun} {_id}: {exc}")
+                        continue
+                    done[_id] = {
+                        "id": _id,
+                        "digest": digests[_id],
+                        "description": description,
+                    }
+                    file.write(json.dumps(done[_id], ensure_ascii=False) + "\n")
+                    file.flush()
+        finally:
+            # an interrupted build doesn't wait for the descriptions queued
+            executor.shutdown(wait=False, cancel_futures=True)
+        # translations of changed descriptions and removed gadgets are dropped
+        records = [
+            done[_id]
+            for _id in descriptions
+            if _id in done and done[_id]["digest"] == digests[_id]
+        ]
+        PayloadStore.build(records, store)
+        journal.unlink()
+        console.log(
+            f"Saved {len(records)} translations to {store}"
+            + (f", {failed} failed" if failed else "")
+        )
+    catalog_version.bump()
     console.log("Done ✔")
 
 
-def classify_laptop_price(prices) -> str:
+def exact_results(exact: ExactIndex, queries: int, k: int):
+    """
+    Sample queries and find their true nearest neighbours.
+
+    The queries are perturbed catalog vectors, so they aren't trivially
+    found by the indexes being evaluated.
+
+    Args:
+        exact: the exact index of the embeddings
+        queries: the number of queries
+        k: the number of neighbours
+    Returns:
+        The queries and their neighbours
+    """
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(exact), min(queries, len(exact)), replace=False)
+    sample = exact.vectors[rows]
+    sample = sample + rng.normal(scale=0.01, size=sample.shape).astype(np.float32)
+    start = time.perf_counter()
+    expected = exact.search_batch(sample, [k] * len(sample))
+    ms = (time.perf_counter() - start) / len(sample) * 1e3
+    console.log(f"exact search: {ms:.3f}ms per query")
+    return sample, expected
+
+
+def report_recall(label: str, index, sample: np.ndarray, expected: list) -> None:
+    """Log the recall and latency of an index on sampled queries."""
+    k = len(expected[0])
+    start = time.perf_counter()
+    found = index.search_batch(sample, [k] * len(sample))
+    ms = (time.perf_counter() - start) / len(sample) * 1e3
+    console.log(f"{label} recall@{k}={recall(found, expected):.3f} {ms:.3f}ms per query")
+
+
+def build_ann_index(
+    lists=None, k=10, queries=1000, category: Category = LAPTOPS
+) -> IVFIndex:
+    """
+    Build an approximate nearest neighbour index of the embeddings.
+
+    The recall of the index against an exact search is reported for a
+    range of probes so `ANN_PROBES` can be tuned.
+
+    Args:
+        lists: the number of lists of the index
+        k: the number of neighbours used to measure recall
+        queries: the number of queries used to measure recall
+        category: the category whose embeddings are indexed
+    Returns:
+        The index
+    """
+    console.log("Loading embeddings...")
+    vectors = np.load(category.vectors, mmap_mode="r")
+    ids = list(load_payloads(category))
+    console.log(f"Building index of {len(vectors)} vectors...")
+    index = IVFIndex.build(
+        vectors, ids, category.ann_index, lists=lists, probes=ANN_PROBES
+    )
+    console.log(f"Saved {len(index.centroids)} lists to {category.ann_index}")
+
+    exact = ExactIndex(category.vectors, ids)
+    sample, expected = exact_results(exact, queries, k)
+    for probes in sorted({1, 2, 4, 8, 16, 32, ANN_PROBES}):
+        if probes > len(index.centroids):
+            break
+        index.probes = probes
+        report_recall(f"probes={probes:<3}", index, sample, expected)
+    index.probes = ANN_PROBES
+    catalog_version.bump()
+    return index
+
+
+def build_quantized_vectors(
+    dtype="int8", k=10, queries=1000, category: Category = LAPTOPS
+) -> QuantizedIndex:
+    """
+    Quantize the embeddings for in-process search.
+
+    The memory and recall of the quantized vectors are reported against
+    the full precision vectors, with and without rescoring.
+
+    Args:
+        dtype: "int8" or "float16"
+        k: the number of neighbours used to measure recall
+        queries: the number of queries used to measure recall
+        category: the category whose embeddings are quantized
+    Returns:
+        The index
+    """
+    console.log("Loading embeddings...")
+    vectors = np.load(category.vectors, mmap_mode="r")
+    ids = list(load_payloads(category))
+    console.log(f"Quantizing {len(vectors)} vectors to {dtype}...")
+    index = QuantizedIndex.build(
+        vectors,
+        ids,
+        category.quantized,
+        dtype=dtype,
+        originals=category.vectors,
+        rescore=QUANTIZED_RESCORE,
+    )
+    exact = ExactIndex(category.vectors, ids)
+    console.log(
+        f"Saved to {category.quantized}: {index.codes.nbytes / 2**20:.1f}MiB,"
+        f" {exact.vectors.size * 4 / 2**20:.1f}MiB as float32"
+    )
+    sample, expected = exact_results(exact, queries, k)
+    for rescore in sorted({0, 2, 4, 8, QUANTIZED_RESCORE}):
+        index.rescore = rescore
+        index.vectors = exact.vectors if rescore else None
+        report_recall(f"rescore={rescore:<2}", index, sample, expected)
+    catalog_version.bump()
+    return QuantizedIndex(category.quantized, category.vectors, rescore=QUANTIZED_RESCORE)
+
+
+def load_payloads(category: Category = LAPTOPS) -> PayloadStore | MemoryStore:
+    """
+    Load laptops, or the gadgets of another category, keyed by their id.
+
+    The memory-mapped payload store is used when it has been built since
+    the raw json database last changed, otherwise the database is parsed.
+    Either way, every lookup decodes a new laptop.
+
+    Returns:
+        A read-only mapping of laptop id to laptop
+    """
+    try:
+        if category.store.stat().st_mtime >= category.db.stat().st_mtime:
+            return PayloadStore(category.store)
+    except (OSError, PayloadStoreError):
+        pass
+    data: list[dict] = json.loads(category.db.read_text())
+    return MemoryStore(data)
+
+
+def data_stamp(category: Category = LAPTOPS) -> str:
+    """
+    Identify the state of the files the laptops, or phones, are loaded from.
+
+    Editing the raw json database changes it without a rebuild changing
+    the catalog version.
+    """
+    stamps = []
+    for path in (category.db, category.store):
+        try:
+            stat = path.stat()
+            stamps.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        except FileNotFoundError:
+            stamps.append("")
+    return hashlib.blake2b("|".join(stamps).encode(), digest_size=4).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query's unicode form, case and whitespace."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def classify_laptop_price(prices, noun: str = "laptop") -> str:
     """
     Classify laptop price.
 
     Args:
         prices: the list of prices to classify
+        noun: what the gadget is called
     Returns:
         The classification
     """
     if not prices:
-        return "This laptop is mid-range."
+        return f"This {noun} is mid-range."
 
     price_values = []
     for price in prices:
@@ -125,72 +476,968 @@ def classify_laptop_price(prices) -> str:
 
     avg_price = sum(price_values) / len(price_values)
     if avg_price < 500:
-        return "This laptop is very affordable."
+        return f"This {noun} is very affordable."
     elif avg_price < 1000:
-        return "This laptop is moderately priced."
+        return f"This {noun} is moderately priced."
     else:
-        return "This laptop is expensive."
+        return f"This {noun} is expensive."
+
+
+class CursorError(Exception):
+    """Raised when a pagination cursor is unknown or expired."""
+
+
+class CatalogSnapshot:
+    """
+    A version of the catalog of a category and of the indexes built from it.
+
+    A snapshot is never changed. Laptops are decoded anew on every lookup,
+    so the results of a search are its own copies. Indexes are loaded on
+    first use, or by `warm` before a reloaded snapshot is swapped in.
+    """
+
+    def __init__(self, backend: str = SEARCH_BACKEND, category: Category = LAPTOPS):
+        """
+        Load the laptops of a snapshot.
+
+        Args:
+            backend: where vectors are searched, see `NeuralSearcher`
+            category: the category of the catalog
+        Raises:
+            CatalogNotBuilt: when the vectors searched aren't built
+        """
+        self.backend = backend
+        self.category = category
+        # `salesman build` embeds a category before uploading it, a
+        # category without embeddings has no collection either
+        vectors = {"ivf": category.ann_index, "quantized": category.quantized}.get(
+            backend, category.vectors
+        )
+        if not vectors.exists():
+            raise CatalogNotBuilt(
+                f"The {category.name} aren't searched, {vectors} is missing."
+                f" Build them with `salesman build --category {category.name}`"
+            )
+        # read first, a rebuild during the load changes it again. the
+        # version keys cached responses, it changes with the data served
+        self.version = f"{catalog_version.get()}-{data_stamp(category)}"
+        self.data = load_payloads(category)
+
+    def lookup(self, ids: Iterable[int]) -> list[dict]:
+        """
+        Look gadgets up, skipping ids that aren't in the snapshot.
+
+        Ids ranked against an earlier snapshot or by a Qdrant collection
+        that is being uploaded may be gone. Every gadget is tagged with
+        its category.
+        """
+        gadgets = [self.data[_id] for _id in ids if _id in self.data]
+        for gadget in gadgets:
+            gadget["category"] = self.category.name
+        return gadgets
+
+    @cached_property
+    def index(self) -> ExactIndex | IVFIndex | QuantizedIndex | None:
+        """The in process index, `None` when searching Qdrant."""
+        category = self.category
+        ids = list(self.data)
+        index: IVFIndex | QuantizedIndex
+        if self.backend == "exact":
+            return ExactIndex(category.vectors, ids)
+        if self.backend == "ivf":
+            index = IVFIndex(category.ann_index, probes=ANN_PROBES)
+        elif self.backend == "quantized":
+            index = QuantizedIndex(
+                category.quantized, category.vectors, rescore=QUANTIZED_RESCORE
+            )
+        else:
+            return None
+        # the catalog changed since the index was built, its rows no
+        # longer line up with the ones filters select
+        if not index.matches(ids):
+            console.log(
+                f"The {self.backend} index of the {category.name} was built"
+                " from another catalog, searching exactly until it's rebuilt"
+            )
+            return ExactIndex(category.vectors, ids)
+        return index
+
+    @cached_property
+    def local_index(self) -> ExactIndex | IVFIndex | QuantizedIndex | None:
+        """
+        The index searched in process, the local embeddings stand in for
+        Qdrant when it misses its deadline. `None` when there are none.
+        """
+        if self.index is not None:
+            return self.index
+        if not self.category.vectors.exists():
+            return None
+        return ExactIndex(self.category.vectors, list(self.data))
+
+    @cached_property
+    def lexical(self) -> LexicalIndex | None:
+        """The lexical index, `None` when it hasn't been built."""
+        if not self.category.lexical.exists():
+            return None
+        return LexicalIndex.load(self.category.lexical)
+
+    @cached_property
+    def fields(self) -> FieldTable:
+        """The normalized fields of the catalog, used to filter locally."""
+        return FieldTable(
+            (self.data[_id] for _id in self.data), self.category.fields
+        )
+
+    @cached_property
+    def translations(self) -> dict[str, PayloadStore]:
+        """The descriptions translated ahead of time, by language."""
+        pattern = self.category.translations("*")
+        prefix, suffix = pattern.name.split("*")
+        stores: dict[str, PayloadStore] = {}
+        for path in sorted(pattern.parent.glob(pattern.name)):
+            lang = path.name[len(prefix) : -len(suffix)]
+            try:
+                stores[lang] = PayloadStore(path)
+            except PayloadStoreError as exc:
+                console.log(f"Skipping the translations to {lang!r}: {exc}")
+        return stores
+
+    def translated(self, gadget: dict, lang: str) -> str | None:
+        """
+        Get the description of a gadget translated ahead of time.
+
+        Returns:
+            The translation, `None` when the language wasn't built or the
+            description changed since
+        """
+        store = self.translations.get(lang)
+        if store is None:
+            return None
+        return pretranslated(store, gadget["id"], gadget["description"])
+
+    def warm(self) -> "CatalogSnapshot":
+        """Load the indexes that are otherwise loaded on first use."""
+        _ = self.lexical, self.translations
+        if self.local_index is not None:
+            _ = self.fields
+        return self
+
+
+@cache
+def get_catalog(
+    backend: str = SEARCH_BACKEND, category: Category = LAPTOPS
+) -> Catalog[CatalogSnapshot]:
+    """
+    Get the catalog of a category of the process.
+
+    It's reloaded when the catalog is rebuilt, see `CatalogVersion`, or
+    when the raw json database changes.
+    """
+    return Catalog(
+        lambda: CatalogSnapshot(backend, category),
+        paths=(CATALOG_VERSION, category.db),
+        warm=CatalogSnapshot.warm,
+    )
 
 
 class NeuralSearcher:
-    """A neural searcher."""
+    """A neural searcher of one or more categories of gadgets."""
 
-    def __init__(self, collection_name):
+    def __init__(self, categories=SEARCH_CATEGORIES, backend=SEARCH_BACKEND):
         """
         Initialize a neural searcher.
 
         Args:
-            collection_name: the name of the collection to use when searching
+            categories: the categories to search, or their names, see
+                `categories.py`. Categories whose database is missing are
+                skipped, and those that aren't built are skipped until
+                they are
+            backend: "qdrant" to search the collections on the Qdrant
+                cluster, or in process: "exact" to search the local
+                embeddings, "ivf" to search the local approximate indexes
+                or "quantized" to search the local quantized embeddings
+        Raises:
+            ValueError: when a category or the backend is unknown
         """
-        self.collection_name = collection_name
-        # Initialize encoder model
-        self.model = cohere
-        # initialize Qdrant client
-        self.qdrant_client = qdrant
-        self.data = json.loads(LAPTOP_DB.read_text())
+        if backend not in ("exact", "ivf", "quantized", "qdrant"):
+            raise ValueError(f"unknown search backend: {backend!r}")
+        self.categories = [
+            category if isinstance(category, Category) else get_category(category)
+            for category in categories
+        ]
+        self.backend = backend
+        self._async_qdrant_clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, "AsyncQdrantClient"
+        ] = weakref.WeakKeyDictionary()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+        # identical searches in flight at the same time share their result
+        self.flights = SingleFlight()
+        metrics.on_collect(self.collect_metrics)
 
-    def search(self, text: str, limit=5):
+    # clients, the catalog, indexes and caches are created on first use, so
+    # a searcher costs nothing until it searches
+
+    @cached_property
+    def model(self) -> "CohereClient":
+        """The encoder model."""
+        return get_cohere()
+
+    @cached_property
+    def qdrant_client(self) -> "QdrantClient":
+        """The Qdrant client."""
+        return get_qdrant()
+
+    @cached_property
+    def catalogs(self) -> dict[str, Catalog[CatalogSnapshot]]:
+        """
+        The catalogs of the categories searched, shared by the searchers of
+        the process. The first category is searched even without a database,
+        so the error shows.
+        """
+        found = [c for c in self.categories if c.db.exists()] or self.categories[:1]
+        return {c.name: get_catalog(self.backend, c) for c in found}
+
+    def load_snapshots(self) -> tuple[dict[str, CatalogSnapshot], list[str]]:
+        """
+        Get the current snapshot of each catalog.
+
+        Returns:
+            The snapshots of the catalogs that loaded and the names of the
+            catalogs that failed to. Catalogs that aren't built are in
+            neither, they aren't searched until they are
+        Raises:
+            Exception: when no catalog loads
+        """
+        snapshots, failed, errors = {}, [], []
+        for name, catalog in self.catalogs.items():
+            try:
+                snapshots[name] = catalog.snapshot
+            except CatalogNotBuilt as error:
+                errors.append(error)
+            except Exception as error:
+                failed.append(name)
+                errors.append(error)
+        if not snapshots:
+            raise errors[0]
+        return snapshots, failed
+
+    @property
+    def snapshots(self) -> dict[str, CatalogSnapshot]:
+        """The current snapshot of each catalog searched, see `load_snapshots`."""
+        return self.load_snapshots()[0]
+
+    @property
+    def version(self) -> str:
+        """The versions of the current snapshots, they key cached results."""
+        versions = (snapshot.version for snapshot in self.snapshots.values())
+        return "+".join(dict.fromkeys(versions))
+
+    @cached_property
+    def embedding_cache(self):
+        """Embeddings of queries seen before."""
+        return create_cache(
+            "embeddings",
+            maxsize=EMBEDDING_CACHE_SIZE,
+            ttl=EMBEDDING_CACHE_TTL,
+            path=EMBEDDING_CACHE_DB,
+            disk_maxsize=EMBEDDING_CACHE_DB_SIZE,
+        )
+
+    @cached_property
+    def translator(self) -> DescriptionTranslator:
+        """The translator of descriptions."""
+        return DescriptionTranslator()
+
+    @cached_property
+    def cursors(self):
+        """
+        Cursor -> (query, ranked keys, language, offset of the next page,
+        stages that degraded when ranking).
+        """
+        return create_cache(
+            "cursors",
+            maxsize=SEARCH_CURSOR_CACHE_SIZE,
+            ttl=SEARCH_CURSOR_TTL,
+            path=SEARCH_CURSOR_DB,
+            disk_maxsize=SEARCH_CURSOR_CACHE_SIZE,
+        )
+
+    def preload(self) -> None:
+        """
+        Load what is otherwise loaded on first use, before forking workers
+        or serving concurrent requests.
+
+        Clients are left to be created by each worker.
+        """
+        _ = self.embedding_cache, self.translator, self.cursors
+        for snapshot in self.snapshots.values():
+            snapshot.warm()
+
+    def watch(self, interval: float = CATALOG_WATCH_INTERVAL) -> None:
+        """Reload the catalogs in the background when they change."""
+        for catalog in self.catalogs.values():
+            catalog.watch(interval)
+
+    def reload_in_background(self) -> None:
+        """Reload every catalog in the background."""
+        for catalog in self.catalogs.values():
+            catalog.reload_in_background()
+
+    def collect_metrics(self) -> None:
+        """Update the metrics of the caches and of the searches in flight."""
+        caches = (
+            ("embeddings", self.__dict__.get("embedding_cache")),
+            ("translations", getattr(self.__dict__.get("translator"), "cache", None)),
+            ("cursors", self.__dict__.get("cursors")),
+        )
+        for name, store in caches:
+            # caches that haven't been used yet aren't created to be counted
+            if store is not None:
+                metrics.CACHE_HITS.set(store.hits, name)
+                metrics.CACHE_MISSES.set(store.misses, name)
+        metrics.SEARCHES_COALESCED.set(self.flights.coalesced)
+        metrics.SEARCHES_IN_FLIGHT.set(len(self.flights))
+
+    def embed_many(self, texts: list[str]) -> list[np.ndarray]:
+        """
+        Embed queries, reusing the embeddings of queries seen before.
+
+        Queries that are not cached are embedded in batches.
+
+        Args:
+            texts: the queries to embed
+        Returns:
+            The queries' vectors, in order
+        """
+        texts = [normalize_query(text) for text in texts]
+        vectors = [self.embedding_cache.get(f"{EMBEDDING_MODEL}:{text}") for text in texts]
+        missing = list(
+            dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None)
+        )
+        metrics.record_cache("embeddings", len(texts) - len(missing), len(missing))
+        embedded: dict[str, np.ndarray] = {}
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[start : start + EMBED_BATCH_SIZE]
+            with metrics.stage("embed"):
+                embeddings = self.model.embed(batch, model=EMBEDDING_MODEL).embeddings
+            metrics.record_call("embed", batch)
+            for text, embedding in zip(batch, embeddings):
+                embedded[text] = np.asarray(embedding, dtype=np.float32)
+                self.embedding_cache.set(f"{EMBEDDING_MODEL}:{text}", embedded[text])
+        return [
+            embedded[text] if vector is None else vector
+            for text, vector in zip(texts, vectors)
+        ]
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embed a query, reusing the embeddings of queries seen before.
+
+        Args:
+            text: the query to embed
+        Returns:
+            The query's vector
+        """
+        return self.embed_many([text])[0]
+
+    @property
+    def async_qdrant_client(self) -> "AsyncQdrantClient":
+        """The async Qdrant client of the running event loop."""
+        from qdrant_client import AsyncQdrantClient
+
+        loop = asyncio.get_running_loop()
+        client = self._async_qdrant_clients.get(loop)
+        if client is None:
+            client = AsyncQdrantClient(**QDRANT_INIT_KWARGS)
+            self._async_qdrant_clients[loop] = client
+        return client
+
+    def detect_languages(self, texts: list[str]) -> list[str]:
+        """Detect the language codes of queries."""
+        unique = list(dict.fromkeys(texts))
+        languages: dict[str, str] = {}
+        for start in range(0, len(unique), EMBED_BATCH_SIZE):
+            batch = unique[start : start + EMBED_BATCH_SIZE]
+            with metrics.stage("detect_language"):
+                results = self.model.detect_language(texts=batch).results
+            metrics.record_call("detect_language", batch)
+            for text, result in zip(batch, results):
+                languages[text] = result.language_code
+        return [languages[text] for text in texts]
+
+    def detect_language(self, text: str) -> str:
+        """Detect the language code of a query."""
+        return self.detect_languages([text])[0]
+
+    async def translate(self, payloads: list[dict], lang: str) -> None:
+        """
+        Translate the descriptions of laptops in place.
+
+        Descriptions translated ahead of time are used as they are, only the
+        others are translated live. They are left in English when
+        translating misses the deadline, the translations are still cached
+        when they finish.
+        """
+        # crawled phones aren't described
+        payloads = [laptop for laptop in payloads if laptop.get("description")]
+        if lang == "en" or not payloads:
+            return
+        payloads = self.pretranslate(payloads, lang)
+        if not payloads:
+            return
+
+        async def translate_many():
+            with metrics.stage("translate"):
+                return await asyncio.to_thread(
+                    self.translator.translate_many,
+                    [(laptop["id"], laptop["description"]) for laptop in payloads],
+                    lang,
+                )
+
+        try:
+            descriptions = await deadline.wait("translate", translate_many())
+        except DeadlineExceeded:
+            deadline.degrade("translate")
+            return
+        for laptop, description in zip(payloads, descriptions):
+            laptop["description"] = description
+
+    def pretranslate(self, payloads: list[dict], lang: str) -> list[dict]:
+        """
+        Fill in descriptions translated ahead of time, see `build_translations`.
+
+        Args:
+            payloads: described gadgets, they are translated in place
+            lang: the language to translate to
+        Returns:
+            The gadgets left to translate live
+        """
+        snapshots = self.snapshots
+        missing = []
+        for gadget in payloads:
+            snapshot = snapshots.get(gadget["category"])
+            description = snapshot and snapshot.translated(gadget, lang)
+            if description is None:
+                missing.append(gadget)
+            else:
+                gadget["description"] = description
+        metrics.record_cache(
+            "pretranslations", len(payloads) - len(missing), len(missing)
+        )
+        return missing
+
+    @staticmethod
+    def fuse(
+        snapshot: CatalogSnapshot,
+        text: str,
+        hits: list,
+        limit: int,
+        constraints: Constraints,
+    ) -> list:
+        """
+        Fuse the vector hits of a query with its lexical hits.
+
+        A fused hit is scored like the vector hit of the same rank, so the
+        rankings of different catalogs can be merged by score.
+
+        Args:
+            snapshot: the catalog searched
+            text: the query
+            hits: the vector hits, closest first
+            limit: the number of results
+            constraints: the constraints of the query
+        Returns:
+            The best hits of both rankings
+        """
+        if snapshot.lexical is None:
+            return hits[:limit]
+        lexical = snapshot.lexical.search(text, limit=max(len(hits), limit))
+        if constraints:
+            lexical = [
+                hit for hit in lexical
+                if hit.id in snapshot.data
+                and constraints.matches(
+                    snapshot.category.fields(snapshot.data[hit.id])
+                )
+            ]
+        fused = reciprocal_rank_fusion([hits, lexical])[:limit]
+        if not hits:
+            return fused
+        return [
+            Hit(hit.id, hits[min(rank, len(hits) - 1)].score)
+            for rank, hit in enumerate(fused)
+        ]
+
+    async def search_vectors(
+        self,
+        snapshot: CatalogSnapshot,
+        vectors: list[np.ndarray],
+        limits: list[int],
+        constraints: list[Constraints],
+    ):
+        """
+        Find the closest laptops to many vectors.
+
+        Args:
+            snapshot: the catalog searched
+            vectors: the query vectors
+            limits: the number of results of each query
+            constraints: the constraints the results of each query satisfy
+        Returns:
+            The hits of each query, closest first
+        Raises:
+            DeadlineExceeded: when Qdrant misses its deadline and there
+                are no local embeddings
+        """
+        index = snapshot.index
+        if index is None:
+            try:
+                return await deadline.wait(
+                    "vector_search",
+                    self.search_qdrant(snapshot.category, vectors, limits, constraints),
+                )
+            except DeadlineExceeded:
+                index = snapshot.local_index
+                if index is None:
+                    raise
+                deadline.degrade("vector_search")
+        masks = None
+        if any(constraints):
+            masks = [snapshot.fields.mask(c) for c in constraints]
+        return await asyncio.to_thread(
+            index.search_batch, np.stack(vectors), limits, masks
+        )
+
+    async def search_qdrant(
+        self,
+        category: Category,
+        vectors: list[np.ndarray],
+        limits: list[int],
+        constraints: list[Constraints],
+    ):
+        """Find the closest gadgets to many vectors in a category's collection."""
+        from qdrant_client.models import SearchRequest
+
+        keys = category.fields({})
+        # Use the vectors to search for the closest vectors in the collection,
+        # the constraints are applied by the index instead of over-fetching
+        metrics.record_call("qdrant")
+        return await self.async_qdrant_client.search_batch(
+            collection_name=category.collection_name,
+            requests=[
+                SearchRequest(
+                    vector=vector.tolist(),
+                    with_payload=False,
+                    filter=c.to_filter(keys),
+                    limit=limit,
+                )
+                for vector, limit, c in zip(vectors, limits, constraints)
+            ],
+        )
+
+    async def rank_many(
+        self, texts: list[str], limits: list[int]
+    ) -> tuple[list[list[Key]], list[str]]:
+        """
+        Rank gadgets for many queries at once.
+
+        The queries are embedded with a single call to the embedding model
+        per batch, and the catalog of every category is searched with the
+        same vectors at the same time, with a single batch request each.
+        A query naming a category, like "gaming laptop", only searches it,
+        and the rankings of the categories searched are merged by score,
+        see `merge_by_score`. Constraints in the queries, like a budget or
+        a brand, filter the results. Queries that are a model number are
+        looked up in the lexical indexes and others are ranked by both
+        indexes. When the deadline is near, queries are ranked by the
+        lexical indexes alone if they are not embedded in time, and are
+        assumed to be in English if their language is not detected in time.
+        A category whose catalog fails to load, or whose vectors fail to
+        be searched, is left to its lexical index and flagged as degraded.
+
+        Args:
+            texts: the queries
+            limits: the number of results of each query
+        Returns:
+            The category and id of the closest gadgets for each query and
+            the language of each query
+        Raises:
+            DeadlineExceeded: when the queries are not embedded in time and
+                there is no lexical index
+        """
+        # the same snapshots are searched even if new ones are swapped in
+        snapshots, failed = self.load_snapshots()
+        for name in failed:
+            deadline.degrade(name)
+        lexicals = {
+            name: snapshot.lexical
+            for name, snapshot in snapshots.items()
+            if snapshot.lexical is not None
+        }
+        ranks: list[list[Key]] = [[] for _ in texts]
+        langs = ["en"] * len(texts)
+        # queries that are a model number are answered without any upstream call
+        pending = []
+        with metrics.stage("lexical"):
+            for i, text in enumerate(texts):
+                keys = [
+                    (name, _id)
+                    for name, lexical in lexicals.items()
+                    for _id in lexical.match_mpn(text)
+                ]
+                if keys:
+                    ranks[i] = keys[: limits[i]]
+                else:
+                    pending.append(i)
+        if not pending:
+            return ranks, langs
+        texts = [texts[i] for i in pending]
+        limits = [limits[i] for i in pending]
+
+        async def embed():
+            try:
+                return await deadline.wait(
+                    "embed", asyncio.to_thread(self.embed_many, texts)
+                )
+            except DeadlineExceeded:
+                if not lexicals:
+                    raise
+                deadline.degrade("embed")
+                return None
+
+        async def detect():
+            try:
+                return await deadline.wait(
+                    "detect_language", asyncio.to_thread(self.detect_languages, texts)
+                )
+            except DeadlineExceeded:
+                deadline.degrade("detect_language")
+                return ["en"] * len(texts)
+
+        vectors, detected = await asyncio.gather(embed(), detect())
+        constraints = [parse_query(text) for text in texts]
+        targets = [mentioned_categories(text, list(snapshots)) for text in texts]
+
+        async def search(name: str) -> dict[int, list]:
+            """Search a catalog with the queries that target it."""
+            snapshot = snapshots[name]
+            rows = [j for j, target in enumerate(targets) if name in target]
+            if vectors is None or not rows:
+                return {j: [] for j in rows}
+            # extra candidates are fetched to be fused with the lexical ranking
+            depth = [limits[j] * (1 if snapshot.lexical is None else 2) for j in rows]
+            results = await self.search_vectors(
+                snapshot,
+                [vectors[j] for j in rows],
+                depth,
+                [constraints[j] for j in rows],
+            )
+            return dict(zip(rows, results))
+
+        with metrics.stage("vector_search"):
+            outcomes = await asyncio.gather(
+                *map(search, snapshots), return_exceptions=True
+            )
+        searched = {}
+        for name, outcome in zip(snapshots, outcomes):
+            if not isinstance(outcome, Exception):
+                searched[name] = outcome
+                continue
+            # a category whose index or collection is broken is left to its
+            # lexical index, unless every category failed
+            if isinstance(outcome, DeadlineExceeded) or all(
+                isinstance(other, Exception) for other in outcomes
+            ):
+                raise outcome
+            logger.error("searching %s failed", name, exc_info=outcome)
+            deadline.degrade(name)
+            searched[name] = {
+                j: [] for j, target in enumerate(targets) if name in target
+            }
+        # `searched` contains found vector ids with similarity scores, the
+        # payloads are looked up locally.
+        with metrics.stage("lexical"):
+            for j, (i, text, limit, c) in enumerate(
+                zip(pending, texts, limits, constraints)
+            ):
+                rankings = {
+                    name: self.fuse(snapshots[name], text, searched[name][j], limit, c)
+                    for name in targets[j]
+                }
+                merged = merge_by_score(rankings, limit, CATEGORY_QUOTAS)
+                ranks[i] = [(name, hit.id) for name, hit in merged]
+                langs[i] = detected[j]
+        return ranks, langs
+
+    def lookup(self, keys: Iterable[Key]) -> list[dict]:
+        """
+        Look gadgets up in the current snapshots, see `CatalogSnapshot.lookup`.
+
+        Args:
+            keys: the category and id of each gadget
+        Returns:
+            The gadgets that are still in the catalogs, in order
+        """
+        snapshots = self.snapshots
+        return [
+            gadget
+            for name, _id in keys
+            if name in snapshots
+            for gadget in snapshots[name].lookup([_id])
+        ]
+
+    async def asearch_many(self, texts: list[str], limits: list[int]):
+        """
+        Query the database with many queries at once, see `rank_many`.
+
+        Args:
+            texts: the queries
+            limits: the number of results of each query
+        Returns:
+            The closest gadgets for each query, in order, translated to
+            the language of their query
+        """
+        ranks, langs = await self.rank_many(texts, limits)
+        with metrics.stage("payloads"):
+            results = [self.lookup(keys) for keys in ranks]
+        await asyncio.gather(
+            *(self.translate(payloads, lang) for payloads, lang in zip(results, langs))
+        )
+        return results
+
+    async def arank_page(
+        self, text: str, limit=5, cursor: str | None = None
+    ) -> tuple[list[dict], str, str | None]:
+        """
+        Find a page of laptops without translating them.
+
+        The first page ranks a window of `SEARCH_WINDOW_SIZE` results once,
+        later pages are served from that window without calling any
+        upstream model.
+
+        Args:
+            text: text to use to query database
+            limit: the number of results of the page
+            cursor: the cursor returned with the previous page, `None` for
+                the first page
+        Returns:
+            The laptops of the page, the language of `text` and the cursor
+            of the next page, `None` on the last page
+        Raises:
+            CursorError: when the cursor is unknown or expired
+        """
+        if cursor is None:
+            depth = max(limit, SEARCH_WINDOW_SIZE)
+            ranks, langs = await deadline.coalesce(
+                self.flights,
+                ("rank", normalize_query(text), depth),
+                lambda: self.rank_many([text], [depth]),
+            )
+            keys, lang, offset = ranks[0], langs[0], 0
+            current = deadline.current_deadline()
+            # later pages of a degraded ranking are flagged as well
+            degraded = tuple(sorted(current.degraded)) if current else ()
+        else:
+            window = self.cursors.get(cursor)
+            metrics.record_cache("cursors", window is not None, window is None)
+            if window is None or window[0] != text:
+                raise CursorError(f"unknown or expired cursor: {cursor!r}")
+            _, keys, lang, offset, degraded = window
+            deadline.inherit(degraded)
+        with metrics.stage("payloads"):
+            payloads = self.lookup(keys[offset : offset + limit])
+        next_cursor = None
+        if offset + limit < len(keys):
+            next_cursor = secrets.token_urlsafe(16)
+            self.cursors.set(next_cursor, (text, keys, lang, offset + limit, degraded))
+        return payloads, lang, next_cursor
+
+    async def asearch_page(
+        self, text: str, limit=5, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        """
+        Query the database one page at a time, see `arank_page`.
+
+        Only the laptops of the page are translated. Identical pages
+        searched at the same time are only searched once.
+
+        Args:
+            text: text to use to query database
+            limit: the number of results of the page
+            cursor: the cursor returned with the previous page
+        Returns:
+            The laptops of the page and the cursor of the next page
+        """
+
+        async def search_page():
+            payloads, lang, next_cursor = await self.arank_page(text, limit, cursor)
+            await self.translate(payloads, lang)
+            return payloads, next_cursor
+
+        payloads, next_cursor = await deadline.coalesce(
+            self.flights, ("page", normalize_query(text), limit, cursor), search_page
+        )
+        # every caller gets its own copies of the shared laptops
+        return [dict(laptop) for laptop in payloads], next_cursor
+
+    async def atranslations(self, payloads: list[dict], lang: str):
+        """
+        Translate the descriptions of laptops one by one.
+
+        Args:
+            payloads: the laptops, they are left untouched
+            lang: the language to translate to
+        Yields:
+            The category, id and translated description of each laptop, as
+            soon as it is translated, until the deadline
+        """
+        if lang == "en":
+            return
+
+        async def translate(laptop: dict) -> tuple[str, int, str]:
+            with metrics.stage("translate"):
+                description = await self.flights.run(
+                    ("translate", laptop["category"], laptop["id"], lang),
+                    lambda: asyncio.to_thread(
+                        self.translator.translate,
+                        laptop["id"],
+                        laptop["description"],
+                        lang,
+                    ),
+                )
+            return laptop["category"], laptop["id"], description
+
+        # descriptions translated ahead of time come first, on copies
+        described = [dict(laptop) for laptop in payloads if laptop.get("description")]
+        missing = self.pretranslate(described, lang)
+        for laptop in described:
+            if laptop not in missing:
+                yield laptop["category"], laptop["id"], laptop["description"]
+        current = deadline.current_deadline()
+        timeout = current.timeout("translate") if current else None
+        translations = [translate(laptop) for laptop in missing]
+        try:
+            for translation in asyncio.as_completed(translations, timeout=timeout):
+                yield await translation
+        except asyncio.TimeoutError:
+            deadline.degrade("translate")
+
+    async def asearch(self, text: str, limit=5):
         """
         Query the database.
 
+        Calls to the embedding and language detection models don't depend
+        on each other, so they are made at the same time. Identical queries
+        searched at the same time are only searched once.
+
         Args:
             text: text to use to query database
+            limit: the number of results
+        Returns:
+            The closest laptops, translated to the language of `text`
         """
-        # Convert text query into vector
-        vector = self.model.embed([text], model="multilingual-22-12").embeddings[0]
-        lang = self.model.detect_language(texts=[text]).results[0].language_code
-        translator= Translator(to_lang=lang)
-        # print(f"Vectors: {vector}")
-
-        # Use `vector` for search for closest vectors in the collection
-        search_result = self.qdrant_client.search(
-            collection_name=self.collection_name,
-            query_vector=np.array(vector),
-            with_payload=False,
-            query_filter=None,  # We don't want any filters for now
-            limit=limit,  # 5 the most closest results is enough
+
+        async def search():
+            return (await self.asearch_many([text], [limit]))[0]
+
+        payloads = await deadline.coalesce(
+            self.flights, ("search", normalize_query(text), limit), search
         )
-        # Je veux un ordinateur portable étudiant
-        # print(search_result[0])
-        # print("\n---\n")
-        # print(self.data[search_result[0].id])
-        # `search_result` contains found vector ids with similarity
-        # scores along with the stored payload
-        # In this function we are interested in payload only
-        payloads = []
-        for hit in search_result:
-            for laptop in self.data:
-                if laptop["id"] == hit.id:
-                    break
-            if lang != "en":
-                desc = laptop['description']
-                if len(desc) > 400:
-                    index = desc.find(" ", 400)
-                    first = translator.translate(desc[:index])
-                    second = translator.translate(desc[index + 1:])
-                    desc = first + " " + second
-                    laptop['description'] = desc
-                else:
-                    laptop["description"] = translator.translate(laptop["description"])
-            payloads.append(laptop)
-        return payloads
+        # every caller gets its own copies of the shared laptops
+        return [dict(laptop) for laptop in payloads]
+
+    def run(self, coro):
+        """
+        Run a coroutine on the searcher's event loop and wait for it.
+
+        The loop runs in a background thread, so synchronous callers from
+        any thread share it and the async clients bound to it. The
+        coroutine sees the context variables of the caller.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop.set_default_executor(
+                    ThreadPoolExecutor(UPSTREAM_WORKERS, thread_name_prefix="upstream")
+                )
+                threading.Thread(
+                    target=self._loop.run_forever, name="searcher", daemon=True
+                ).start()
+        context = contextvars.copy_context()
+
+        async def in_context():
+            for var, value in context.items():
+                var.set(value)
+            return await coro
+
+        return asyncio.run_coroutine_threadsafe(in_context(), self._loop).result()
+
+    def search(self, text: str, limit=5):
+        """
+        Query the database, see `asearch`.
+
+        Args:
+            text: text to use to query database
+            limit: the number of results
+        """
+        return self.run(self.asearch(text, limit=limit))
+
+    def search_page(self, text: str, limit=5, cursor: str | None = None):
+        """
+        Query the database one page at a time, see `asearch_page`.
+
+        Args:
+            text: text to use to query database
+            limit: the number of results of the page
+            cursor: the cursor returned with the previous page
+        """
+        return self.run(self.asearch_page(text, limit=limit, cursor=cursor))
+
+    def rank_page(self, text: str, limit=5, cursor: str | None = None):
+        """
+        Find a page of laptops without translating them, see `arank_page`.
+
+        Args:
+            text: text to use to query database
+            limit: the number of results of the page
+            cursor: the cursor returned with the previous page
+        """
+        return self.run(self.arank_page(text, limit=limit, cursor=cursor))
+
+    def translations(self, payloads: list[dict], lang: str):
+        """
+        Translate the descriptions of laptops one by one, see `atranslations`.
+
+        Args:
+            payloads: the laptops, they are left untouched
+            lang: the language to translate to
+        """
+        translations = self.atranslations(payloads, lang)
+
+        async def step():
+            return await translations.__anext__()
+
+        while True:
+            try:
+                yield self.run(step())
+            except StopAsyncIteration:
+                return
+
+    def search_many(self, texts: list[str], limits: list[int] | int = 5):
+        """
+        Query the database with many queries at once, see `asearch_many`.
+
+        Args:
+            texts: the queries
+            limits: the number of results of each query, or of every query
+        """
+        if isinstance(limits, int):
+            limits = [limits] * len(texts)
+        return self.run(self.asearch_many(texts, limits))
+
+
+@cache
+def get_searcher() -> NeuralSearcher:
+    """Get the searcher of the process, it's created on first use."""
+    return NeuralSearcher(SEARCH_CATEGORIES)
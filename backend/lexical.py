@@ -0,0 +1,161 @@
+"""
+Lexical Search.
+
+This file contains an in-process inverted index over the `name`, `mpn` and
+`info` of every laptop. Multilingual embeddings handle model numbers such
+as `9S7-17L212-655` badly, so queries that are an exact MPN are answered
+from the index directly and other queries fuse its BM25 ranking with the
+vector ranking.
+"""
+
+import pickle
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterable, Sequence, Union
+
+import numpy as np
+
+from .vector_index import Hit
+
+FIELDS = ("name", "mpn", "info")
+TOKEN = re.compile(r"\w+")
+# something that looks like a model number: letters and digits, no spaces
+MPN_LIKE = re.compile(r"(?=\S*\d)(?=\S*[a-z])\S{5,}", re.IGNORECASE)
+
+
+def tokenize(text: str) -> list[str]:
+    """Split a text into lowercase words."""
+    return TOKEN.findall(text.lower())
+
+
+def normalize_mpn(mpn: str) -> str:
+    """Normalize a model number, ignoring case and punctuation."""
+    return "".join(TOKEN.findall(mpn.upper())).replace("_", "")
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[Hit]], k: int = 60) -> list[Hit]:
+    """
+    Fuse rankings, a result scores 1 / (k + rank) in every ranking it's in.
+
+    Args:
+        rankings: the rankings to fuse, best first
+        k: dampens the weight of the top ranks
+    Returns:
+        The fused ranking, best first
+    """
+    scores: dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit.id] += 1 / (k + rank)
+    return [Hit(_id, score) for _id, score in sorted(scores.items(), key=lambda x: -x[1])]
+
+
+class LexicalIndex:
+    """A BM25 index with an exact lookup of model numbers."""
+
+    def __init__(self, ids, postings, mpns):
+        """
+        Initialize a lexical index, use `build` or `load` instead.
+
+        Args:
+            ids: the id of each document
+            postings: token -> (documents, BM25 weights)
+            mpns: normalized model number -> ids
+        """
+        self.ids = ids
+        self.postings = postings
+        self.mpns = mpns
+
+    @classmethod
+    def build(cls, laptops: Iterable[dict], k1: float = 1.2, b: float = 0.75):
+        """
+        Index laptops.
+
+        Args:
+            laptops: the laptops to index
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        Returns:
+            The index
+        """
+        ids: list[int] = []
+        counts: list[Counter] = []
+        mpns: dict[str, list[int]] = defaultdict(list)
+        for laptop in laptops:
+            ids.append(laptop["id"])
+            tokens = tokenize(" ".join(str(laptop.get(f) or "") for f in FIELDS))
+            counts.append(Counter(tokens))
+            if laptop.get("mpn"):
+                mpns[normalize_mpn(laptop["mpn"])].append(laptop["id"])
+        lengths = np.array([sum(c.values()) for c in counts], np.float32)
+        average = lengths.mean() if len(lengths) else 1.0
+
+        documents: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for document, count in enumerate(counts):
+            for token, frequency in count.items():
+                documents[token].append((document, frequency))
+        postings = {}
+        for token, found in documents.items():
+            rows = np.array([document for document, _ in found], np.int32)
+            tf = np.array([frequency for _, frequency in found], np.float32)
+            idf = np.log(1 + (len(ids) - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = k1 * (1 - b + b * lengths[rows] / average)
+            postings[token] = (rows, (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+        return cls(np.array(ids, np.int64), postings, dict(mpns))
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Save the index."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as file:
+            pickle.dump(
+                (self.ids, self.postings, self.mpns), file, pickle.HIGHEST_PROTOCOL
+            )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "LexicalIndex":
+        """Load an index saved with `save`."""
+        with open(path, "rb") as file:
+            return cls(*pickle.load(file))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def match_mpn(self, text: str) -> list[int]:
+        """
+        Find laptops by model number.
+
+        Args:
+            text: a query, it matches when it is a model number or when
+                one of its words is
+        Returns:
+            The ids of the laptops, empty when nothing matches
+        """
+        ids = self.mpns.get(normalize_mpn(text), [])
+        if not ids:
+            for word in MPN_LIKE.findall(text):
+                ids = ids + self.mpns.get(normalize_mpn(word), [])
+        return list(dict.fromkeys(ids))
+
+    def search(self, text: str, limit: int = 10) -> list[Hit]:
+        """
+        Rank laptops by BM25.
+
+        Args:
+            text: the query
+            limit: the number of results
+        Returns:
+            The hits, best first
+        """
+        scores = np.zeros(len(self.ids), np.float32)
+        for token in set(tokenize(text)):
+            if token in self.postings:
+                rows, weights = self.postings[token]
+                scores[rows] += weights
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [Hit(int(self.ids[row]), float(scores[row])) for row in matched]
@@ -0,0 +1,329 @@
+"""
+Metrics.
+
+This file contains the metrics of the search path: a latency histogram,
+a count and an error counter per stage of a search, request latencies
+and in-flight gauges, and the hit rates of the caches. They are kept in
+process and rendered in the Prometheus text format at `/metrics`.
+Recording a sample takes a lock and a bisect, so they are always on.
+
+A single request can also be traced, see `tracing`. The trace is held in
+a context variable, so it follows the request into tasks and threads,
+and recording costs a lookup of that variable when nothing is traced.
+"""
+
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, Iterator, Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# seconds, upstream calls take from a few to a few hundred milliseconds
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0,
+)
+
+
+def escape(value) -> str:
+    """Escape a label value."""
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    """Format label names and values, `{name="value"}`."""
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """A metric with a value per combination of its labels."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        """
+        Initialize a metric.
+
+        Args:
+            name: the name of the metric
+            help: what the metric measures
+            labels: the names of the labels of the metric
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels) -> None:
+        """Set the value of the metric."""
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        """Increase the value of the metric."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """Get the name, labels and value of each sample."""
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, format_labels(self.labels, labels), value
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(
+            f"{name}{labels} {value:g}" for name, labels, value in self.samples()
+        )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+
+class Gauge(Metric):
+    """A value that goes up and down."""
+
+    type = "gauge"
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        """Decrease the value of the metric."""
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Counts of observations in buckets, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        """
+        Initialize a histogram.
+
+        Args:
+            name: the name of the metric
+            help: what the metric measures
+            labels: the names of the labels of the metric
+            buckets: the upper bounds of the buckets
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._histograms: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        """Record an observation."""
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                # a count per bucket and for +Inf, then the sum
+                histogram = [0] * (len(self.buckets) + 1) + [0.0]
+                self._histograms[labels] = histogram
+            histogram[bisect_left(self.buckets, value)] += 1
+            histogram[-1] += value
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        with self._lock:
+            histograms = [(labels, list(h)) for labels, h in self._histograms.items()]
+        names = self.labels + ("le",)
+        for labels, histogram in histograms:
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram):
+                total += count
+                bucket = format_labels(names, labels + (bound,))
+                yield f"{self.name}_bucket", bucket, total
+            yield f"{self.name}_sum", format_labels(self.labels, labels), histogram[-1]
+            yield f"{self.name}_count", format_labels(self.labels, labels), total
+
+
+STAGE_SECONDS = Histogram(
+    "salesman_stage_seconds", "Latency of each stage of a search.", ("stage",)
+)
+STAGE_ERRORS = Counter(
+    "salesman_stage_errors_total",
+    "Errors raised by each stage of a search.",
+    ("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "salesman_request_seconds",
+    "Latency of api requests until their response starts.",
+    ("route",),
+)
+REQUEST_ERRORS = Counter(
+    "salesman_request_errors_total", "Api requests that failed.", ("route",)
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "salesman_requests_in_flight", "Api requests being handled.", ("route",)
+)
+CACHE_HITS = Counter("salesman_cache_hits_total", "Cache hits.", ("cache",))
+CACHE_MISSES = Counter("salesman_cache_misses_total", "Cache misses.", ("cache",))
+SEARCHES_COALESCED = Counter(
+    "salesman_searches_coalesced_total",
+    "Searches that waited for an identical search in flight.",
+)
+SEARCHES_IN_FLIGHT = Gauge(
+    "salesman_searches_in_flight", "Distinct searches and translations in flight."
+)
+DEGRADED = Counter(
+    "salesman_degraded_total",
+    "Stages of a search that degraded to meet its deadline.",
+    ("stage",),
+)
+CATALOG_RELOADS = Counter(
+    "salesman_catalog_reloads_total",
+    "Catalog snapshots loaded to replace the current one.",
+    ("result",),
+)
+METRICS = [
+    STAGE_SECONDS,
+    STAGE_ERRORS,
+    REQUEST_SECONDS,
+    REQUEST_ERRORS,
+    REQUESTS_IN_FLIGHT,
+    CACHE_HITS,
+    CACHE_MISSES,
+    SEARCHES_COALESCED,
+    SEARCHES_IN_FLIGHT,
+    DEGRADED,
+    CATALOG_RELOADS,
+]
+_collectors: list[Callable[[], Callable[[], None] | None]] = []
+
+
+class Trace:
+    """The timing breakdown of a single request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = defaultdict(float)
+        self.calls: dict[str, int] = defaultdict(int)
+        self.bytes = 0
+        self.caches: dict[str, dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0}
+        )
+        self.translated_chars = 0
+
+    def to_dict(self) -> dict:
+        """Summarize the trace, times are in milliseconds."""
+        return {
+            "total_ms": (time.perf_counter() - self.started) * 1e3,
+            "stages_ms": {name: seconds * 1e3 for name, seconds in self.stages.items()},
+            "upstream_calls": dict(self.calls),
+            # utf-8 bytes of the texts exchanged, not of the vectors
+            "upstream_bytes": self.bytes,
+            "caches": dict(self.caches),
+            "translated_chars": self.translated_chars,
+        }
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+@contextmanager
+def tracing(enabled: bool = True):
+    """
+    Trace the current request.
+
+    Args:
+        enabled: whether to trace, nothing is recorded otherwise
+    Yields:
+        The trace, `None` when disabled
+    """
+    if not enabled:
+        yield None
+        return
+    token = _trace.set(Trace())
+    try:
+        yield _trace.get()
+    finally:
+        _trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    """Get the trace of the current request, `None` when it's not traced."""
+    return _trace.get()
+
+
+def record_call(upstream: str, sent: Iterable[str] = (), received: Iterable[str] = ()):
+    """
+    Record a call to an upstream service.
+
+    Args:
+        upstream: the name of the service
+        sent: the texts sent to the service
+        received: the texts received from the service
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace.calls[upstream] += 1
+        trace.bytes += sum(len(text.encode()) for text in (*sent, *received))
+
+
+def record_cache(name: str, hits: int = 0, misses: int = 0) -> None:
+    """Record lookups in a cache."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.caches[name]["hits"] += hits
+        trace.caches[name]["misses"] += misses
+
+
+def record_translation(chars: int) -> None:
+    """Record characters sent to the translator."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.translated_chars += chars
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of a search, counting the errors it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.stages[name] += elapsed
+
+
+def on_collect(callback: Callable[[], None]) -> None:
+    """
+    Call a function before the metrics are rendered.
+
+    Args:
+        callback: a function that updates metrics, bound methods are not
+            kept alive by the registration
+    """
+    if hasattr(callback, "__self__"):
+        _collectors.append(weakref.WeakMethod(callback))
+    else:
+        _collectors.append(lambda: callback)
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text format."""
+    for collector in list(_collectors):
+        method = collector()
+        if method is None:
+            _collectors.remove(collector)
+        else:
+            method()
+    return "".join(metric.render() for metric in METRICS)
+
@@ -0,0 +1,170 @@
+"""
+Payload Store.
+
+This file contains a compact, memory-mapped store for catalog records.
+The store is a single binary file laid out as::
+
+    header | record | record | ... | index
+
+Every record is serialized as compact json and the index maps a record id
+to the offset and length of that record in the file. The file is memory
+mapped when opened so every process serving the catalog shares the same
+page-cache copy, and a record is only decoded when it is looked up.
+"""
+
+import json
+import mmap
+import os
+import struct
+from collections.abc import Iterable, Iterator, Mapping
+from pathlib import Path
+from typing import Any, Union
+
+MAGIC = b"SLMNPS01"
+# magic, number of records, offset of the index
+HEADER = struct.Struct("<8sQQ")
+# id, offset, length
+INDEX_ENTRY = struct.Struct("<qQQ")
+
+
+class PayloadStoreError(Exception):
+    """Raised when a payload store is missing or corrupt."""
+
+
+class PayloadStore(Mapping):
+    """A read-only, memory-mapped mapping of record id to record."""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open a payload store.
+
+        Args:
+            path: the path of a store created with `PayloadStore.build`
+        """
+        self.path = Path(path)
+        try:
+            with open(self.path, "rb") as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as exc:
+            raise PayloadStoreError(f"cannot open {self.path}: {exc}") from exc
+        if len(self._mmap) < HEADER.size:
+            raise PayloadStoreError(f"{self.path} is not a payload store")
+        magic, count, index_offset = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise PayloadStoreError(f"{self.path} is not a payload store")
+        if index_offset + count * INDEX_ENTRY.size > len(self._mmap):
+            raise PayloadStoreError(f"{self.path} is truncated")
+        # the index is tiny compared to the records, so it is unpacked
+        # once to give O(1) lookups while the records stay on disk.
+        self._index: dict[int, tuple[int, int]] = {}
+        for _id, offset, length in INDEX_ENTRY.iter_unpack(
+            self._mmap[index_offset : index_offset + count * INDEX_ENTRY.size]
+        ):
+            self._index[_id] = (offset, length)
+
+    @classmethod
+    def build(
+        cls, records: Iterable[dict], path: Union[str, Path], key: str = "id"
+    ) -> "PayloadStore":
+        """
+        Serialize records into a new payload store.
+
+        The store is written to a temporary file first and moved into
+        place, so readers never see a partially written store.
+
+        Args:
+            records: the records to store
+            path: where to save the store
+            key: the record field that holds the record's id
+        Returns:
+            The newly built store
+        """
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        index: list[bytes] = []
+        with open(tmp, "wb") as file:
+            file.write(HEADER.pack(MAGIC, 0, 0))
+            offset = HEADER.size
+            for record in records:
+                blob = json.dumps(record, separators=(",", ":")).encode()
+                file.write(blob)
+                index.append(INDEX_ENTRY.pack(record[key], offset, len(blob)))
+                offset += len(blob)
+            file.write(b"".join(index))
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, len(index), offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+        return cls(path)
+
+    def raw(self, _id: int) -> bytes:
+        """
+        Get the serialized bytes of a record.
+
+        Args:
+            _id: the id of the record
+        Returns:
+            The record as compact json
+        """
+        offset, length = self._index[_id]
+        return self._mmap[offset : offset + length]
+
+    def __getitem__(self, _id: int) -> dict[str, Any]:
+        """Decode a record, a new object is returned on every call."""
+        return json.loads(self.raw(_id))
+
+    def __contains__(self, _id: object) -> bool:
+        return _id in self._index
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over record ids in the order they were stored."""
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        """Unmap the store."""
+        self._mmap.close()
+
+
+class MemoryStore(Mapping):
+    """
+    A read-only mapping of record id to record, kept serialized in memory.
+
+    It stands in for a `PayloadStore` that hasn't been built: records are
+    stored as compact json and a new object is decoded on every lookup,
+    so no caller can change what another one sees.
+    """
+
+    def __init__(self, records: Iterable[dict], key: str = "id"):
+        """
+        Serialize records.
+
+        Args:
+            records: the records to store
+            key: the record field that holds the record's id
+        """
+        self._records: dict[int, bytes] = {
+            record[key]: json.dumps(record, separators=(",", ":")).encode()
+            for record in records
+        }
+
+    def raw(self, _id: int) -> bytes:
+        """Get the serialized bytes of a record."""
+        return self._records[_id]
+
+    def __getitem__(self, _id: int) -> dict[str, Any]:
+        """Decode a record, a new object is returned on every call."""
+        return json.loads(self._records[_id])
+
+    def __contains__(self, _id: object) -> bool:
+        return _id in self._records
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over record ids in the order they were stored."""
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,472 @@
+"""
+Parse Query Constraints.
+
+This file contains functionalities used to extract hard constraints such
+as a budget, an amount of RAM or a brand from a query. The constraints are
+matched against normalized fields of every laptop, either by Qdrant as
+payload filters or in process as a mask over the catalog. Each category
+has its own fields, see `laptop_fields` and `phone_fields`, a category
+isn't filtered by a constraint on a field it doesn't have.
+
+    >>> parse_query("gaming laptop under $1000 with 32GB RAM")
+    Constraints(max_price=1000.0, min_ram_gb=32.0, target_users=['gamers'])
+
+A number is only taken for a price when it has a currency, a `k` suffix or
+the size of a price, and no unit:
+
+    >>> parse_query("business laptop under 1500")
+    Constraints(max_price=1500.0, target_users=['business professionals'])
+    >>> parse_query("laptop between 800 and 1.2k")
+    Constraints(min_price=800.0, max_price=1200.0)
+    >>> parse_query("laptop under 2kg for kids under 10")
+    Constraints()
+    >>> parse_query("laptop from 2020 with more than 4 usb ports, max 3 years old")
+    Constraints()
+
+Catalog prices are in dollars, prices in euros are converted with
+`USD_PER_EUR`:
+
+    >>> parse_query("portable gamer moins de 800 €")
+    Constraints(max_price=864.0, target_users=['gamers'])
+
+A screen size on its own stands for its size class, a "15 inch" laptop has
+a 15.6" screen:
+
+    >>> parse_query("15 inch laptop for students")
+    Constraints(min_screen_inch=15.0, max_screen_inch=15.9, target_users=['students'])
+    >>> parse_query('16" laptop')
+    Constraints(min_screen_inch=16.0, max_screen_inch=16.9)
+    >>> parse_query("laptop at least 13.3 inches")
+    Constraints(min_screen_inch=13.3)
+"""
+
+import math
+import re
+from dataclasses import dataclass, field, fields
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional
+
+import numpy as np
+
+from .config import USD_PER_EUR
+
+if TYPE_CHECKING:
+    from qdrant_client.models import Filter
+
+# normalized payload fields and how Qdrant should index them, the values
+# of `PayloadSchemaType`, which is only imported when talking to Qdrant
+FIELDS = {
+    "price_usd": "float",
+    "ram_gb": "float",
+    "storage_gb": "float",
+    "screen_inch": "float",
+    "brand": "keyword",
+    "target_users": "keyword",
+}
+
+BRANDS = {
+    "acer": "acer",
+    "alienware": "alienware",
+    "apple": "apple",
+    "macbook": "apple",
+    "asus": "asus",
+    "rog": "asus",
+    "zenbook": "asus",
+    "chuwi": "chuwi",
+    "dell": "dell",
+    "xps": "dell",
+    "dynabook": "dynabook",
+    "fujitsu": "fujitsu",
+    "gigabyte": "gigabyte",
+    "google": "google",
+    "hp": "hp",
+    "hewlett packard": "hp",
+    "huawei": "huawei",
+    "lenovo": "lenovo",
+    "thinkpad": "lenovo",
+    "lg": "lg",
+    "medion": "medion",
+    "microsoft": "microsoft",
+    "surface": "microsoft",
+    "msi": "msi",
+    "panasonic": "panasonic",
+    "razer": "razer",
+    "samsung": "samsung",
+    "toshiba": "toshiba",
+    "xiaomi": "xiaomi",
+}
+
+TARGET_USERS = {
+    r"gam(?:e|er|ers|ing)|jeux?|juegos?|spiele[nr]?": "gamers",
+    r"students?|school|college|university|étudiants?|estudiantes?|studenten": "students",
+    r"business|office|entreprise|negocios?": "business professionals",
+    r"creative|designers?|artists?|(?:video|photo) editing": "creative professionals",
+    r"everyday|casual|home use": "everyday users",
+    r"hardcore|power users?|workstation": "hardcore users",
+}
+
+EURO = r"(?:€|eur|euros?)"
+CURRENCY = rf"(?:\$|usd|dollars?|{EURO})"
+AT_MOST = (
+    r"(?:under|below|less than|cheaper than|at most|max(?:imum)?|up to|within|<=?"
+    r"|moins de|jusqu'à|menos de|hasta|unter|bis zu)"
+)
+AT_LEAST = (
+    r"(?:over|above|more than|at least|min(?:imum)?|from|>=?"
+    r"|plus de|au moins|más de|al menos|über|mindestens)"
+)
+COMPARATOR = rf"(?:({AT_MOST}|{AT_LEAST})\s*)?"
+# a whole number such as 1,200 or 1.5k, that is not a size, a weight, a
+# frequency, a duration or a count
+AMOUNT = (
+    r"(\d+(?:[.,]\d+)*)(?![\d.,])\s*(k\b)?"
+    r"(?!\s*(?:[kmgt]b|\"|”|''|inch|in\b|hz|ghz|cores?|%|mp\b|h\b|hours?"
+    r"|kg|g\b|lbs?\b|grams?|mm\b|cm\b|w\b|watts?|mah|years?|yrs?|months?|days?"
+    r"|ports?|usb|slots?|fans?|keys|screens?|monitors?|kids?|users?|people))"
+)
+# a number without a currency or a `k` suffix is only a price from there,
+# "under 10" or "more than 4" are rather ages or counts
+MIN_BARE_PRICE = 100
+
+PRICE_RANGE = re.compile(
+    rf"(?:between\s*|{CURRENCY}\s*){AMOUNT}\s*{CURRENCY}?\s*(?:and|-|to)\s*"
+    rf"{CURRENCY}?\s*{AMOUNT}"
+)
+PRICE_BOUND = re.compile(
+    rf"({AT_MOST}|{AT_LEAST})\s*(?:a budget of\s*)?{CURRENCY}?\s*{AMOUNT}"
+    rf"(?:\s*{CURRENCY}(?!\w))?"
+)
+BUDGET = re.compile(
+    rf"budget (?:of|is)\s*{CURRENCY}?\s*{AMOUNT}(?:\s*{CURRENCY}(?!\w))?"
+)
+RAM = re.compile(
+    rf"{COMPARATOR}(\d+)\s*gb\s*(?:of\s*)?(?:ram|memory)"
+    r"|(?:ram|memory)\s*(?:of\s*)?(\d+)\s*gb"
+)
+STORAGE = re.compile(
+    rf"{COMPARATOR}(\d+(?:\.\d+)?)\s*(?:(gb|tb)\s*(?:of\s*)?"
+    r"(?:ssd|hdd|storage|drive|disk|nvme|emmc)|(tb)\b)"
+)
+# sizes without a unit, small ones are RAM and large ones are storage
+BARE_SIZE = re.compile(rf"{COMPARATOR}(\d+)\s*gb\b")
+SCREEN = re.compile(
+    rf"{COMPARATOR}(\d{{2}}(?:[.,]\d)?)\s*(?:\"|”|''|-?\s*(?:inch(?:es)?|pouces|pulgadas|zoll)\b|in\b)"
+)
+
+
+@dataclass
+class Constraints:
+    """Hard constraints on the laptops a query accepts."""
+
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_ram_gb: Optional[float] = None
+    max_ram_gb: Optional[float] = None
+    min_storage_gb: Optional[float] = None
+    max_storage_gb: Optional[float] = None
+    min_screen_inch: Optional[float] = None
+    max_screen_inch: Optional[float] = None
+    brands: list[str] = field(default_factory=list)
+    target_users: list[str] = field(default_factory=list)
+
+    def __repr__(self) -> str:
+        values = (
+            f"{f.name}={getattr(self, f.name)!r}"
+            for f in fields(self)
+            if getattr(self, f.name) not in (None, [])
+        )
+        return f"Constraints({', '.join(values)})"
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, f.name) not in (None, []) for f in fields(self))
+
+    def ranges(self) -> dict[str, tuple[Optional[float], Optional[float]]]:
+        """Get the bounds of every constrained numeric field."""
+        bounds = {
+            "price_usd": (self.min_price, self.max_price),
+            "ram_gb": (self.min_ram_gb, self.max_ram_gb),
+            "storage_gb": (self.min_storage_gb, self.max_storage_gb),
+            "screen_inch": (self.min_screen_inch, self.max_screen_inch),
+        }
+        return {key: bound for key, bound in bounds.items() if bound != (None, None)}
+
+    def keywords(self) -> dict[str, list[str]]:
+        """Get the accepted values of every constrained keyword field."""
+        keywords = {"brand": self.brands, "target_users": self.target_users}
+        return {key: values for key, values in keywords.items() if values}
+
+    def matches(self, fields: dict[str, Any]) -> bool:
+        """
+        Check the normalized fields of a laptop against the constraints.
+
+        Args:
+            fields: the fields, see `laptop_fields`, constraints on fields
+                that aren't there are ignored
+        Returns:
+            Whether the laptop satisfies the constraints
+        """
+        for key, (low, high) in self.ranges().items():
+            if key not in fields:
+                continue
+            value = fields.get(key)
+            if value is None:
+                return False
+            if (low is not None and value < low) or (high is not None and value > high):
+                return False
+        for key, values in self.keywords().items():
+            if key not in fields:
+                continue
+            found = fields.get(key)
+            found = found if isinstance(found, list) else [found]
+            if not set(found) & set(values):
+                return False
+        return True
+
+    def to_filter(self, keys: Optional[Iterable[str]] = None) -> Optional["Filter"]:
+        """
+        Convert the constraints to a Qdrant filter.
+
+        Args:
+            keys: the fields of the collection, every field of `FIELDS`
+                when `None`, constraints on other fields are ignored
+        """
+        from qdrant_client.models import FieldCondition, Filter, MatchAny, Range
+
+        keys = set(FIELDS if keys is None else keys)
+        conditions = [
+            FieldCondition(key=key, range=Range(gte=low, lte=high))
+            for key, (low, high) in self.ranges().items()
+            if key in keys
+        ]
+        conditions += [
+            FieldCondition(key=key, match=MatchAny(any=values))
+            for key, values in self.keywords().items()
+            if key in keys
+        ]
+        return Filter(must=conditions) if conditions else None
+
+
+def to_number(value: str, thousands: Optional[str] = None) -> float:
+    """Convert a matched number such as "1,200", "1.5" or "2k" to a float."""
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", value):
+        value = re.sub(r"[.,]", "", value)
+    number = float(value.replace(",", "."))
+    return number * 1000 if thousands else number
+
+
+def is_price(match: re.Match, value: float, thousands: Optional[str]) -> bool:
+    """
+    Check that an amount matched by a price pattern is a price.
+
+    It is when it has a currency or a `k` suffix, or when it's at least
+    `MIN_BARE_PRICE` and isn't a year after "from", like "from 2020".
+    """
+    if thousands or re.search(CURRENCY, match.group(0)):
+        return True
+    return value >= MIN_BARE_PRICE and not match.group(0).startswith("from")
+
+
+def to_usd(match: re.Match, price: float) -> float:
+    """Convert a matched price to dollars, the currency of catalog prices."""
+    if re.search(EURO, match.group(0)):
+        return round(price * USD_PER_EUR, 2)
+    return price
+
+
+def bound(
+    constraints: Constraints, name: str, comparator: Optional[str], value: float
+) -> None:
+    """Set the lower or upper bound of a field from a comparator."""
+    if comparator is not None and re.fullmatch(AT_MOST, comparator):
+        setattr(constraints, f"max_{name}", value)
+    else:
+        setattr(constraints, f"min_{name}", value)
+
+
+def parse_query(text: str) -> Constraints:
+    """
+    Extract constraints from a query.
+
+    Args:
+        text: the query
+    Returns:
+        The constraints, they are empty when the query has none
+    """
+    text = text.lower()
+    constraints = Constraints()
+
+    for match in SCREEN.finditer(text):
+        comparator, size = match.groups()
+        size = to_number(size)
+        if comparator is None:
+            # screens are sized to a tenth of an inch and named after the
+            # whole inches, 15.6" is a 15 inch screen
+            constraints.min_screen_inch = float(math.floor(size))
+            constraints.max_screen_inch = math.floor(size) + 0.9
+        else:
+            bound(constraints, "screen_inch", comparator, size)
+
+    for match in RAM.finditer(text):
+        comparator, ram, ram_after = match.groups()
+        bound(constraints, "ram_gb", comparator, float(ram or ram_after))
+
+    for match in STORAGE.finditer(text):
+        comparator, size, unit, tb = match.groups()
+        size = float(size) * (1000 if (unit or tb) == "tb" else 1)
+        bound(constraints, "storage_gb", comparator, size)
+
+    for match in BARE_SIZE.finditer(text):
+        comparator, size = match.groups()
+        if RAM.match(text, match.start()) or STORAGE.match(text, match.start()):
+            continue
+        name = "ram_gb" if int(size) <= 64 else "storage_gb"
+        bound(constraints, name, comparator, float(size))
+
+    match = PRICE_RANGE.search(text)
+    if match and is_price(match, to_number(match[3], match[4]), match[2] or match[4]):
+        low, low_k, high, high_k = match.groups()
+        constraints.min_price = to_usd(match, to_number(low, low_k))
+        constraints.max_price = to_usd(match, to_number(high, high_k))
+    else:
+        for match in PRICE_BOUND.finditer(text):
+            comparator, value, thousands = match.groups()
+            price = to_number(value, thousands)
+            if is_price(match, price, thousands):
+                bound(constraints, "price", comparator, to_usd(match, price))
+        match = BUDGET.search(text)
+        if match and constraints.max_price is None:
+            constraints.max_price = to_usd(match, to_number(*match.groups()))
+
+    for name, brand in BRANDS.items():
+        if re.search(rf"\b{name}\b", text) and brand not in constraints.brands:
+            constraints.brands.append(brand)
+
+    for pattern, target_user in TARGET_USERS.items():
+        if re.search(rf"\b(?:{pattern})\b", text):
+            constraints.target_users.append(target_user)
+    return constraints
+
+
+def laptop_fields(laptop: dict) -> dict[str, Any]:
+    """
+    Get the normalized fields of a laptop that constraints are matched to.
+
+    Args:
+        laptop: the laptop
+    Returns:
+        The fields, missing values are `None`
+    """
+    data = laptop.get("data") or {}
+    prices = [
+        float(price["price"]) for price in laptop.get("prices") or [] if price.get("price")
+    ]
+    brand = (data.get("general") or {}).get("brand")
+    target_users = re.split(r",|\band\b", (laptop.get("target_user") or "").lower())
+    return {
+        "price_usd": min(prices) if prices else None,
+        "ram_gb": (data.get("memory") or {}).get("ram__gb"),
+        "storage_gb": (data.get("storage") or {}).get("capacity__gb"),
+        "screen_inch": (data.get("display") or {}).get("size__inch"),
+        "brand": brand.strip().lower() if brand else None,
+        "target_users": [user.strip() for user in target_users if user.strip()],
+    }
+
+
+def phone_fields(phone: dict) -> dict[str, Any]:
+    """
+    Get the normalized fields of a phone that constraints are matched to.
+
+    Phones have no RAM nor target users, so they aren't filtered by them.
+
+    Args:
+        phone: the phone
+    Returns:
+        The fields, missing values are `None`
+    """
+    data = phone.get("data") or {}
+    prices = [
+        float(price["price"]) for price in phone.get("prices") or [] if price.get("price")
+    ]
+    brand = (data.get("general") or {}).get("brand")
+    return {
+        "price_usd": min(prices) if prices else None,
+        "storage_gb": (data.get("storage") or {}).get("capacity__gb"),
+        "screen_inch": (data.get("display") or {}).get("size__inch"),
+        "brand": brand.strip().lower() if brand else None,
+    }
+
+
+class FieldTable:
+    """The normalized fields of a catalog as columns, in catalog order."""
+
+    def __init__(
+        self,
+        laptops: Iterable[dict],
+        fields: Callable[[dict], dict[str, Any]] = laptop_fields,
+    ):
+        """
+        Collect the fields of laptops.
+
+        Args:
+            laptops: the laptops, in the order of the embeddings
+            fields: the fields of the category, see `laptop_fields`
+        """
+        rows = [fields(laptop) for laptop in laptops]
+        keys = fields({})
+        self.size = len(rows)
+        self.numbers = {
+            key: np.array(
+                [np.nan if row[key] is None else row[key] for row in rows], np.float64
+            )
+            for key, schema in FIELDS.items()
+            if schema == "float" and key in keys
+        }
+        # keyword value -> laptops having it
+        self.keywords: dict[str, dict[str, np.ndarray]] = {
+            key: {} for key in ("brand", "target_users") if key in keys
+        }
+        for position, row in enumerate(rows):
+            values = {
+                "brand": [row.get("brand")],
+                "target_users": row.get("target_users", []),
+            }
+            for key, found in values.items():
+                if key not in self.keywords:
+                    continue
+                for value in found:
+                    if value is None:
+                        continue
+                    if value not in self.keywords[key]:
+                        self.keywords[key][value] = np.zeros(self.size, bool)
+                    self.keywords[key][value][position] = True
+
+    def mask(self, constraints: Constraints) -> Optional[np.ndarray]:
+        """
+        Find the laptops that satisfy constraints.
+
+        Args:
+            constraints: the constraints
+        Returns:
+            Whether each laptop satisfies the constraints, `None` when
+            there are no constraints
+        """
+        if not constraints:
+            return None
+        mask = np.ones(self.size, bool)
+        # comparisons with missing (nan) values are false, fields the
+        # category doesn't have don't filter it
+        for key, (low, high) in constraints.ranges().items():
+            if key not in self.numbers:
+                continue
+            if low is not None:
+                mask &= self.numbers[key] >= low
+            if high is not None:
+                mask &= self.numbers[key] <= high
+        for key, values in constraints.keywords().items():
+            if key not in self.keywords:
+                continue
+            accepted = np.zeros(self.size, bool)
+            for value in values:
+                if value in self.keywords[key]:
+                    accepted |= self.keywords[key][value]
+            mask &= accepted
+        return mask
@@ -0,0 +1,210 @@
+"""
+Translate Search Results.
+
+This file contains functionalities used to translate laptop descriptions
+into the language of a query. Translations are cached by laptop, the hash
+of the description and the target language, so a description is only
+translated again when it changes.
+
+Descriptions are split into chunks at sentence boundaries and every chunk
+of every description is translated concurrently, so translating a page of
+results takes about as long as its slowest chunk. The translation
+provider is only imported once a first description is translated.
+
+Descriptions can also be translated ahead of time, by `salesman build
+--languages`, into a store per category and language. Each translation
+keeps the digest of the description it was made from, so a description
+that changed since is translated live again.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Mapping, Optional
+
+from . import metrics
+from .cache import create_cache
+from .config import (
+    TRANSLATION_CACHE_DB,
+    TRANSLATION_CACHE_DB_SIZE,
+    TRANSLATION_CACHE_SIZE,
+    TRANSLATION_CACHE_TTL,
+    TRANSLATION_WORKERS,
+)
+
+if TYPE_CHECKING:
+    from translate import Translator
+
+# the translation provider rejects long texts
+MAX_CHUNK_SIZE = 400
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_text(text: str, size: int = MAX_CHUNK_SIZE) -> list[str]:
+    """
+    Split a text into chunks of whole sentences.
+
+    Sentences are packed into chunks of at most `size` characters, a
+    sentence longer than that is split between words.
+
+    Args:
+        text: the text to split
+        size: the maximum size of a chunk
+    Returns:
+        The chunks
+    """
+    pieces: list[str] = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > size:
+            index = sentence.rfind(" ", 0, size + 1)
+            if index <= 0:
+                index = size
+            pieces.append(sentence[:index])
+            sentence = sentence[index:].lstrip()
+        if sentence:
+            pieces.append(sentence)
+    chunks: list[str] = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= size:
+            chunks[-1] += " " + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def digest(text: str) -> str:
+    """Hash a description, a translation is only valid for the text it was made from."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def pretranslated(store: Mapping[int, dict], _id: int, text: str) -> Optional[str]:
+    """
+    Get a description translated ahead of time.
+
+    Args:
+        store: the translations of a category to a language
+        _id: the id of the gadget
+        text: its description
+    Returns:
+        The translation, `None` when it's missing or the description changed
+    """
+    if _id not in store:
+        return None
+    record = store[_id]
+    if record["digest"] != digest(text):
+        return None
+    return record["description"]
+
+
+def read_journal(path: Path) -> dict[int, dict]:
+    """
+    Read the translations recorded by a build that didn't compact them.
+
+    A line cut short by an interrupted build is skipped.
+
+    Args:
+        path: the journal, one json translation per line
+    Returns:
+        The last translation of each id
+    """
+    records: dict[int, dict] = {}
+    if not path.exists():
+        return records
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["id"]] = record
+    return records
+
+
+class DescriptionTranslator:
+    """Translates laptop descriptions through a persistent cache."""
+
+    def __init__(self, workers: int = TRANSLATION_WORKERS):
+        """
+        Initialize a description translator.
+
+        Args:
+            workers: the number of chunks translated at the same time
+        """
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="translate")
+        self._translators: dict[str, "Translator"] = {}
+        self._lock = threading.Lock()
+        self.cache = create_cache(
+            "translations",
+            maxsize=TRANSLATION_CACHE_SIZE,
+            ttl=TRANSLATION_CACHE_TTL,
+            path=TRANSLATION_CACHE_DB,
+            disk_maxsize=TRANSLATION_CACHE_DB_SIZE,
+        )
+
+    @staticmethod
+    def key(_id: int, text: str, lang: str) -> str:
+        """Get the cache key of a translation."""
+        return f"{_id}:{digest(text)}:{lang}"
+
+    def translator(self, lang: str) -> "Translator":
+        """Get the translator of a language, it's shared by every request."""
+        from translate import Translator
+
+        with self._lock:
+            if lang not in self._translators:
+                self._translators[lang] = Translator(to_lang=lang)
+            return self._translators[lang]
+
+    def translate_many(
+        self, descriptions: Iterable[tuple[int, str]], lang: str
+    ) -> list[str]:
+        """
+        Translate laptop descriptions concurrently.
+
+        Args:
+            descriptions: pairs of laptop id and description
+            lang: the language to translate to
+        Returns:
+            The translated descriptions, in order
+        """
+        descriptions = list(descriptions)
+        keys = [self.key(_id, text, lang) for _id, text in descriptions]
+        translations = [self.cache.get(key) for key in keys]
+        missing = [i for i, translation in enumerate(translations) if translation is None]
+        metrics.record_cache(
+            "translations", len(translations) - len(missing), len(missing)
+        )
+        if not missing:
+            return translations
+        translator = self.translator(lang)
+        chunks = {i: split_text(descriptions[i][1]) for i in missing}
+        # identical chunks are only translated once
+        futures = {
+            chunk: self.executor.submit(translator.translate, chunk)
+            for i in missing
+            for chunk in chunks[i]
+        }
+        if metrics.current_trace() is not None:
+            for chunk, future in futures.items():
+                metrics.record_call("translate", [chunk], [future.result()])
+                metrics.record_translation(len(chunk))
+        for i in missing:
+            translations[i] = " ".join(futures[chunk].result() for chunk in chunks[i])
+            self.cache.set(keys[i], translations[i])
+        return translations
+
+    def translate(self, _id: int, text: str, lang: str) -> str:
+        """
+        Translate a laptop's description.
+
+        Args:
+            _id: the id of the laptop
+            text: the description
+            lang: the language to translate to
+        Returns:
+            The translated description
+        """
+        return self.translate_many([(_id, text)], lang)[0]
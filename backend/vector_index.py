@@ -0,0 +1,485 @@
+"""
+Local Vector Search.
+
+This file contains vector indexes that answer nearest neighbour queries
+in process, without a network hop to Qdrant. Rows of the embedding matrix
+are in the same order as the laptops in the database.
+
+`ExactIndex` compares a query with every vector. `QuantizedIndex` does
+the same over int8 or float16 copies of the vectors, which take 2-4 times
+less memory. `IVFIndex` is an approximate index for large catalogs: vectors
+are clustered around centroids and a query is only compared with the
+vectors of its closest clusters.
+"""
+
+import math
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+
+class Hit(NamedTuple):
+    """A search result, shaped like Qdrant's `ScoredPoint`."""
+
+    id: int
+    score: float
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors to unit length so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def row_norms(vectors: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Get the length of each vector, a block of rows is read at a time."""
+    norms = np.concatenate(
+        [
+            np.linalg.norm(vectors[start : start + chunk], axis=1)
+            for start in range(0, len(vectors), chunk)
+        ]
+    ).astype(np.float32)
+    norms[norms == 0] = 1
+    return norms
+
+
+def top_k(scores: np.ndarray, limits: Sequence[int]) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Select the best scores of each row.
+
+    Args:
+        scores: a matrix of scores, one row per query, excluded columns
+            are scored `-inf`
+        limits: the number of results of each query
+    Returns:
+        The columns and scores of the best results of each row, best first
+    """
+    k = min(max(limits), scores.shape[1])
+    if k < scores.shape[1]:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(k), scores.shape)
+    best = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-best, axis=1, kind="stable")
+    columns = np.take_along_axis(columns, order, axis=1)
+    best = np.take_along_axis(best, order, axis=1)
+    results = []
+    for i, limit in enumerate(limits):
+        keep = np.isfinite(best[i, :limit])
+        results.append((columns[i, :limit][keep], best[i, :limit][keep]))
+    return results
+
+
+# the rows each query accepts
+Masks = Optional[Sequence[Optional[np.ndarray]]]
+
+
+def apply_masks(scores: np.ndarray, masks: Masks) -> np.ndarray:
+    """Exclude the rows each query doesn't accept from its scores."""
+    for i, mask in enumerate(masks or ()):
+        if mask is not None:
+            scores[i, ~mask] = -np.inf
+    return scores
+
+
+class ExactIndex:
+    """
+    Exact cosine similarity search over an embedding matrix.
+
+    The matrix is memory mapped so every process using it shares the same
+    copy, scores are divided by the length of each row rather than
+    normalizing the rows into private memory.
+    """
+
+    def __init__(self, path: Union[str, Path], ids: Sequence[int]):
+        """
+        Load an embedding matrix.
+
+        Args:
+            path: the `.npy` file of the embeddings
+            ids: the id of the laptop of each row
+        """
+        vectors = np.load(path, mmap_mode="r")
+        if len(vectors) != len(ids):
+            raise ValueError(
+                f"{path} has {len(vectors)} vectors but there are {len(ids)} ids"
+            )
+        self.vectors = vectors
+        self.norms = row_norms(vectors)
+        self.ids = np.asarray(ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search_batch(
+        self, vectors: np.ndarray, limits: Sequence[int], masks: Masks = None
+    ) -> list[list[Hit]]:
+        """
+        Find the closest vectors to many queries.
+
+        Args:
+            vectors: the query vectors, one per row
+            limits: the number of results of each query
+            masks: the rows each query accepts, every row when `None`
+        Returns:
+            The hits of each query, closest first
+        """
+        queries = normalize(np.atleast_2d(vectors))
+        scores = apply_masks(queries @ self.vectors.T / self.norms, masks)
+        return [
+            [Hit(int(self.ids[column]), float(score)) for column, score in zip(*best)]
+            for best in top_k(scores, limits)
+        ]
+
+    def search(self, vector: np.ndarray, limit: int = 5) -> list[Hit]:
+        """Find the closest vectors to a query."""
+        return self.search_batch(vector, [limit])[0]
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize unit vectors.
+
+    int8 codes use a scale factor per dimension so the largest value of
+    every dimension maps to 127.
+
+    Args:
+        vectors: the vectors to quantize
+        dtype: "int8" or "float16"
+    Returns:
+        The codes and the scale factor of each dimension
+    """
+    vectors = normalize(vectors)
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(vectors.shape[1], np.float32)
+    if dtype != "int8":
+        raise ValueError(f"cannot quantize to {dtype!r}")
+    scales = np.abs(vectors).max(axis=0) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedIndex:
+    """
+    Exact search over quantized vectors.
+
+    The index is a directory of `.npy` files, the codes are memory mapped
+    so every process using the index shares the same copy:
+
+    - `codes.npy`: the quantized unit vectors
+    - `scales.npy`: the scale factor of each dimension
+    - `ids.npy`: the id of each vector
+
+    Queries are scored against the codes directly. When the original full
+    precision vectors are given, the best `rescore * limit` candidates of a query are
+    scored again with them.
+    """
+
+    # rows converted to float32 at a time, bounds the memory of a search
+    BLOCK_SIZE = 256
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        originals: Optional[Union[str, Path]] = None,
+        rescore: int = 4,
+    ):
+        """
+        Load a quantized index.
+
+        Args:
+            path: the directory of the index
+            originals: the `.npy` file of the full precision vectors, in
+                the same order as the codes
+            rescore: how many candidates per result are rescored
+        """
+        path = Path(path)
+        self.codes = np.load(path.joinpath("codes.npy"), mmap_mode="r")
+        self.scales = np.load(path.joinpath("scales.npy"))
+        self.ids = np.load(path.joinpath("ids.npy"))
+        self.vectors = None
+        if originals is not None and rescore:
+            self.vectors = np.load(originals, mmap_mode="r")
+        self.rescore = rescore
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        ids: Sequence[int],
+        path: Union[str, Path],
+        dtype: str = "int8",
+        **kwargs,
+    ) -> "QuantizedIndex":
+        """
+        Quantize vectors and save them.
+
+        Args:
+            vectors: the vectors to index
+            ids: the id of each vector
+            path: the directory to save the index in
+            dtype: "int8" or "float16"
+            kwargs: passed to the index
+        Returns:
+            The index
+        """
+        codes, scales = quantize(vectors, dtype)
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path.joinpath("codes.npy"), codes)
+        np.save(path.joinpath("scales.npy"), scales)
+        np.save(path.joinpath("ids.npy"), np.asarray(ids, dtype=np.int64))
+        return cls(path, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def matches(self, ids: Sequence[int]) -> bool:
+        """Check the index was built from the rows of a matrix with these ids."""
+        return np.array_equal(self.ids, np.asarray(ids))
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Score unit queries against every vector."""
+        # scaling the query scales every dimension of the codes
+        queries = (queries * self.scales).T
+        scores = np.empty((len(self.codes), queries.shape[1]), np.float32)
+        for start in range(0, len(self.codes), self.BLOCK_SIZE):
+            block = self.codes[start : start + self.BLOCK_SIZE]
+            scores[start : start + len(block)] = block.astype(np.float32) @ queries
+        return scores.T
+
+    def search_batch(
+        self, vectors: np.ndarray, limits: Sequence[int], masks: Masks = None
+    ) -> list[list[Hit]]:
+        """
+        Find the closest vectors to many queries.
+
+        Args:
+            vectors: the query vectors, one per row
+            limits: the number of results of each query
+            masks: the rows each query accepts, every row when `None`
+        Returns:
+            The hits of each query, closest first
+        """
+        queries = normalize(np.atleast_2d(vectors))
+        scores = apply_masks(self.scores(queries), masks)
+        if self.vectors is None:
+            candidates = top_k(scores, limits)
+        else:
+            candidates = []
+            shortlists = top_k(scores, [self.rescore * l for l in limits])
+            for query, (rows, _), limit in zip(queries, shortlists, limits):
+                rows = np.sort(rows)
+                scores = normalize(self.vectors[rows]) @ query
+                [(columns, best)] = top_k(scores[np.newaxis], [limit])
+                candidates.append((rows[columns], best))
+        return [
+            [Hit(int(self.ids[row]), float(score)) for row, score in zip(rows, best)]
+            for rows, best in candidates
+        ]
+
+    def search(self, vector: np.ndarray, limit: int = 5) -> list[Hit]:
+        """Find the closest vectors to a query."""
+        return self.search_batch(vector, [limit])[0]
+
+
+def kmeans(
+    vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    """
+    Cluster unit vectors with spherical k-means.
+
+    Args:
+        vectors: the unit vectors to cluster
+        k: the number of clusters
+        iterations: the number of refinement steps
+        seed: the seed used to pick the initial centroids
+    Returns:
+        The unit centroids of the clusters
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)]
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        clusters, starts = np.unique(assignments[order], return_index=True)
+        # empty clusters keep their previous centroid
+        sums = centroids.copy()
+        sums[clusters] = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Get the closest centroid of each vector."""
+    return np.concatenate(
+        [
+            np.argmax(vectors[start : start + chunk] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk)
+        ]
+    )
+
+
+class IVFIndex:
+    """
+    An inverted file index.
+
+    The index is a directory of `.npy` files which are memory mapped, so
+    every process using the index shares the same copy:
+
+    - `centroids.npy`: the centroid of each list
+    - `vectors.npy`: unit vectors, sorted by list
+    - `ids.npy`: the id of each vector
+    - `rows.npy`: the row of each vector in the embedding matrix
+    - `offsets.npy`: where each list starts in `vectors.npy`
+    """
+
+    def __init__(self, path: Union[str, Path], probes: int = 8):
+        """
+        Load an inverted file index.
+
+        Args:
+            path: the directory of the index
+            probes: the number of lists searched for each query, more
+                probes give better recall and slower searches
+        """
+        path = Path(path)
+        self.centroids = np.load(path.joinpath("centroids.npy"))
+        self.vectors = np.load(path.joinpath("vectors.npy"), mmap_mode="r")
+        self.ids = np.load(path.joinpath("ids.npy"), mmap_mode="r")
+        self.rows = np.load(path.joinpath("rows.npy"), mmap_mode="r")
+        self.offsets = np.load(path.joinpath("offsets.npy"))
+        self.probes = probes
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        ids: Sequence[int],
+        path: Union[str, Path],
+        lists: Optional[int] = None,
+        sample: int = 64,
+        probes: int = 8,
+    ) -> "IVFIndex":
+        """
+        Build an inverted file index and save it.
+
+        Args:
+            vectors: the vectors to index
+            ids: the id of each vector
+            path: the directory to save the index in
+            lists: the number of lists, defaults to 4 * sqrt(len(vectors))
+            sample: the centroids are trained on at most `sample` vectors
+                per list
+            probes: the number of lists searched for each query
+        Returns:
+            The index
+        """
+        vectors = normalize(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        if lists is None:
+            lists = int(4 * math.sqrt(len(vectors)))
+        lists = max(1, min(lists, len(vectors)))
+        rng = np.random.default_rng(0)
+        training = vectors
+        if len(vectors) > lists * sample:
+            training = vectors[rng.choice(len(vectors), lists * sample, replace=False)]
+        centroids = kmeans(training, lists)
+        assignments = assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(lists + 1))
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path.joinpath("centroids.npy"), centroids)
+        np.save(path.joinpath("vectors.npy"), vectors[order])
+        np.save(path.joinpath("ids.npy"), ids[order])
+        np.save(path.joinpath("rows.npy"), order)
+        np.save(path.joinpath("offsets.npy"), offsets)
+        return cls(path, probes=probes)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def matches(self, ids: Sequence[int]) -> bool:
+        """
+        Check the index was built from the rows of a matrix with these ids.
+
+        Masks select rows of the matrix, an index built from an older
+        catalog would apply them to the wrong vectors.
+        """
+        ids = np.asarray(ids)
+        return len(ids) == len(self.ids) and np.array_equal(ids[self.rows], self.ids)
+
+    def search_batch(
+        self, vectors: np.ndarray, limits: Sequence[int], masks: Masks = None
+    ) -> list[list[Hit]]:
+        """
+        Find the approximately closest vectors to many queries.
+
+        A query whose mask leaves fewer than `limit` vectors in its closest
+        lists is answered exactly over the vectors the mask accepts.
+
+        Args:
+            vectors: the query vectors, one per row
+            limits: the number of results of each query
+            masks: the rows of the embedding matrix each query accepts,
+                every row when `None`
+        Returns:
+            The hits of each query, closest first
+        """
+        queries = normalize(np.atleast_2d(vectors))
+        probes = min(self.probes, len(self.centroids))
+        closest = np.argpartition(-(queries @ self.centroids.T), probes - 1, axis=1)
+        results = []
+        masks = masks or [None] * len(queries)
+        for query, lists, limit, mask in zip(queries, closest[:, :probes], limits, masks):
+            rows = np.concatenate(
+                [np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists]
+            )
+            if mask is not None:
+                rows = rows[mask[self.rows[rows]]]
+                # a selective filter leaves too few candidates in the probed
+                # lists, every vector it accepts is scored instead
+                if len(rows) < limit:
+                    rows = np.flatnonzero(mask[self.rows])
+            if not len(rows):
+                results.append([])
+                continue
+            scores = self.vectors[rows] @ query
+            [(columns, best)] = top_k(scores[np.newaxis], [limit])
+            results.append(
+                [
+                    Hit(int(self.ids[rows[column]]), float(score))
+                    for column, score in zip(columns, best)
+                ]
+            )
+        return results
+
+    def search(self, vector: np.ndarray, limit: int = 5) -> list[Hit]:
+        """Find the approximately closest vectors to a query."""
+        return self.search_batch(vector, [limit])[0]
+
+
+def recall(found: list[list[Hit]], expected: list[list[Hit]]) -> float:
+    """
+    Measure how many of the true nearest neighbours a search found.
+
+    Args:
+        found: the hits of each query
+        expected: the true nearest neighbours of each query
+    Returns:
+        The mean recall of the queries
+    """
+    return float(
+        np.mean(
+            [
+                len({hit.id for hit in a} & {hit.id for hit in b}) / max(len(b), 1)
+                for a, b in zip(found, expected)
+            ]
+        )
+    )
@@ -0,0 +1,5 @@
+"""Benchmarks for Salesman."""
+
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
@@ -0,0 +1,101 @@
+"""
+Synthetic Catalog.
+
+This file generates laptop records shaped like `laptops_raw.json` so
+benchmarks can run without the crawled database.
+"""
+
+import json
+import random
+from pathlib import Path
+
+BRANDS = ("Apple", "Asus", "Acer", "Dell", "HP", "Lenovo", "MSI", "Razer")
+TARGET_USERS = (
+    "Hardcore users",
+    "Creative professionals",
+    "Everyday users",
+    "Business professionals",
+    "Gamers",
+    "Students",
+)
+WORDS = (
+    "powerful portable lightweight display battery performance design "
+    "keyboard graphics storage memory processor gaming business student "
+    "creative everyday reliable fast bright colorful sleek durable"
+).split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    """Generate a sentence of random words."""
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_laptop(_id: int, rng: random.Random) -> dict:
+    """
+    Generate a single laptop record.
+
+    Args:
+        _id: the id of the laptop
+        rng: the random number generator to use
+    Returns:
+        The laptop
+    """
+    brand = rng.choice(BRANDS)
+    ram = rng.choice((4, 8, 16, 32, 64))
+    storage = rng.choice((128, 256, 512, 1000, 2000))
+    size = rng.choice((13.3, 14, 15.6, 16, 17.3))
+    mpn = f"{rng.randrange(16**6):06X}-{rng.randrange(10**3):03d}"
+    price = round(rng.uniform(200, 3500), 2)
+    return {
+        "id": _id,
+        "name": f"{brand} {rng.choice(WORDS).capitalize()} {rng.randrange(100, 999)}",
+        "mpn": mpn,
+        "info": (
+            f"Intel Core i{rng.choice((3, 5, 7, 9))} - {rng.randrange(4, 16)} cores"
+            f" - {size} inch - {ram}GB - {storage}GB SSD - Black - {mpn}"
+        ),
+        "data": {
+            section: {
+                f"{section}_field_{n}": rng.choice(
+                    (rng.randrange(1000), sentence(rng, 3), rng.random() > 0.5)
+                )
+                for n in range(12)
+            }
+            for section in (
+                "cpu", "audio", "video", "camera", "design", "battery",
+                "display", "network", "keyboard", "connectivity",
+            )
+        }
+        | {
+            "memory": {"ram__gb": ram},
+            "storage": {"capacity__gb": storage},
+            "display": {"size__inch": size},
+            "general": {"brand": brand, "mpn": mpn},
+        },
+        "images": [
+            {"url": f"https://images.example.com/{_id}/{n}.jpg"} for n in range(2)
+        ],
+        "prices": [
+            {
+                "price": price,
+                "old_price": round(price * 1.2, 2),
+                "currency": "USD",
+                "url": f"https://shop.example.com/{_id}",
+            }
+        ],
+        "spec_info": " ".join(sentence(rng, 8) for _ in range(4)),
+        "target_user": rng.choice(TARGET_USERS),
+        "description": " ".join(sentence(rng, 12) for _ in range(8)),
+    }
+
+
+def make_catalog(size: int, seed: int = 0) -> list[dict]:
+    """Generate `size` laptops."""
+    rng = random.Random(seed)
+    return [make_laptop(_id, rng) for _id in range(1, size + 1)]
+
+
+def write_catalog(path: Path, size: int, seed: int = 0) -> Path:
+    """Generate a catalog and save it as json."""
+    path.write_text(json.dumps(make_catalog(size, seed)))
+    return path
@@ -0,0 +1,180 @@
+"""
+Fake Upstreams.
+
+Stand-ins for Cohere, Qdrant and the translator that answer after a
+configurable latency, so serving benchmarks measure the server and not
+the network. Qdrant is qdrant-client's local mode, every process opens
+its own copy of a collection built once.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+# words that give away the language of a query
+LANGUAGES = {
+    "fr": ("ordinateur", "portable", "pour", "moins"),
+    "es": ("portátil", "para", "barato", "menos"),
+    "de": ("laptop für", "günstig", "unter", "spiele"),
+}
+
+
+class FakeCohere:
+    """A deterministic embedding and language detection model."""
+
+    def __init__(
+        self,
+        dimension: int,
+        embed_latency: float = 0.05,
+        detect_latency: float = 0.05,
+    ):
+        """
+        Initialize a fake model.
+
+        Args:
+            dimension: the size of the embeddings
+            embed_latency: how long embedding takes in seconds
+            detect_latency: how long detecting languages takes in seconds
+        """
+        self.dimension = dimension
+        self.embed_latency = embed_latency
+        self.detect_latency = detect_latency
+
+    def vector(self, text: str) -> list[float]:
+        """Embed a text, the same text always has the same embedding."""
+        rng = np.random.default_rng(zlib.crc32(text.encode()))
+        return rng.standard_normal(self.dimension).tolist()
+
+    def embed(self, texts, model=None):
+        time.sleep(self.embed_latency)
+        return SimpleNamespace(embeddings=[self.vector(text) for text in texts])
+
+    @staticmethod
+    def language(text: str) -> str:
+        """Detect the language of a text from a few telltale words."""
+        text = text.lower()
+        for code, words in LANGUAGES.items():
+            if any(word in text for word in words):
+                return code
+        return "en"
+
+    def detect_language(self, texts):
+        time.sleep(self.detect_latency)
+        return SimpleNamespace(
+            results=[SimpleNamespace(language_code=self.language(t)) for t in texts]
+        )
+
+
+class FakeTranslator:
+    """A translator that returns the text it's given."""
+
+    latency = 0.05
+
+    def __init__(self, to_lang: str):
+        self.to_lang = to_lang
+
+    def translate(self, text: str) -> str:
+        time.sleep(self.latency)
+        return text
+
+
+def build_qdrant(path: Path, collection: str, vectors: np.ndarray, payloads: dict):
+    """
+    Build a collection in qdrant-client's local mode.
+
+    Args:
+        path: the directory of the local storage
+        collection: the name of the collection
+        vectors: the embeddings, in the order of `payloads`
+        payloads: the payload of each point, keyed by id
+    """
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, VectorParams
+
+    client = QdrantClient(path=str(path))
+    client.recreate_collection(
+        collection_name=collection,
+        vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE),
+    )
+    client.upload_collection(
+        collection_name=collection,
+        vectors=vectors,
+        payload=list(payloads.values()),
+        ids=list(payloads),
+    )
+    client.close()
+
+
+def local_qdrant(path: Path, latency: float):
+    """
+    Make async Qdrant clients of a local collection.
+
+    Local storage can only be opened by one client, so every process
+    copies it first.
+
+    Args:
+        path: the directory of the local storage
+        latency: how long every search takes in seconds
+    """
+    from qdrant_client import AsyncQdrantClient
+
+    class SlowQdrantClient(AsyncQdrantClient):
+        async def search_batch(self, *args, **kwargs):
+            await asyncio.sleep(latency)
+            return await super().search_batch(*args, **kwargs)
+
+    def client(**kwargs):
+        copy = path.with_name(f"{path.name}.{os.getpid()}")
+        if not copy.exists():
+            shutil.copytree(path, copy)
+        return SlowQdrantClient(path=str(copy))
+
+    return client
+
+
+def install(
+    searcher,
+    dimension: int,
+    embed_latency: float = 0.05,
+    detect_latency: float = 0.05,
+    translate_latency: float = 0.05,
+    qdrant_latency: float = 0.01,
+    qdrant_path: Path | None = None,
+):
+    """
+    Replace the upstreams of a searcher with fakes.
+
+    Args:
+        searcher: the `NeuralSearcher` to patch
+        dimension: the size of the embeddings
+        embed_latency: how long embedding takes in seconds
+        detect_latency: how long detecting languages takes in seconds
+        translate_latency: how long translating a chunk takes in seconds
+        qdrant_latency: how long a Qdrant search takes in seconds
+        qdrant_path: where to build the local Qdrant collections, used when
+            the searcher searches Qdrant
+    """
+    import qdrant_client
+    import translate
+
+    searcher.model = FakeCohere(dimension, embed_latency, detect_latency)
+    FakeTranslator.latency = translate_latency
+    # the backend imports both clients when it first uses them
+    translate.Translator = FakeTranslator
+    snapshots = searcher.snapshots.values()
+    if any(snapshot.index is None for snapshot in snapshots):
+        for snapshot in snapshots:
+            category = snapshot.category
+            payloads = {
+                _id: category.fields(snapshot.data[_id]) for _id in snapshot.data
+            }
+            build_qdrant(
+                qdrant_path, category.collection_name, np.load(category.vectors), payloads
+            )
+        qdrant_client.AsyncQdrantClient = local_qdrant(qdrant_path, qdrant_latency)
@@ -0,0 +1,119 @@
+"""
+Benchmark The Payload Store.
+
+Compares the memory-mapped payload store against parsing the raw json
+database and scanning it for every hit. Each loader runs in a fresh
+interpreter so startup time and memory are measured in isolation. `anon`
+is the memory private to a worker, the rest of `rss` is page cache that
+every worker mapping the store shares.
+
+    python -m benchmarks.payload_store --synthetic 6400
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from backend.payload_store import PayloadStore
+
+from . import ROOT
+from .catalog import write_catalog
+
+DATABASE = ROOT.joinpath("backend", "database")
+
+WORKER = r"""
+import json, random, sys, time
+
+from backend import payload_store
+
+def memory():
+    stats = {}
+    with open("/proc/self/smaps_rollup") as file:
+        for line in file:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Anonymous"):
+                stats[key] = int(value.split()[0])
+    return stats["Rss"], stats["Anonymous"]
+
+loader, db, store_path, lookups, limit = sys.argv[1:]
+lookups, limit = int(lookups), int(limit)
+base_rss, base_anon = memory()
+
+start = time.perf_counter()
+if loader == "json":
+    data = json.loads(open(db, "rb").read())
+    ids = [laptop["id"] for laptop in data]
+
+    def lookup(_id):
+        for laptop in data:
+            if laptop["id"] == _id:
+                return laptop
+else:
+    data = payload_store.PayloadStore(store_path)
+    ids = list(data)
+    lookup = data.__getitem__
+startup = time.perf_counter() - start
+
+rng = random.Random(0)
+requests = [rng.sample(ids, limit) for _ in range(lookups)]
+start = time.perf_counter()
+for hits in requests:
+    for _id in hits:
+        lookup(_id)
+per_request = (time.perf_counter() - start) / lookups
+rss, anon = memory()
+print(json.dumps({
+    "startup_ms": startup * 1e3,
+    "rss_mb": (rss - base_rss) / 1024,
+    "anon_mb": (anon - base_anon) / 1024,
+    "request_us": per_request * 1e6,
+}))
+"""
+
+
+def run(loader: str, db: Path, store: Path, lookups: int, limit: int) -> dict:
+    """Run one loader in a fresh interpreter."""
+    output = subprocess.check_output(
+        [sys.executable, "-c", WORKER, loader, db, store, str(lookups), str(limit)],
+        cwd=ROOT,
+    )
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--synthetic", type=int, help="generate a catalog of this size")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=5, help="hits per request")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            db = write_catalog(Path(tmp, "laptops_raw.json"), args.synthetic)
+        else:
+            db = DATABASE.joinpath("laptops_raw.json")
+        store = Path(tmp, "laptops.store")
+        PayloadStore.build(json.loads(db.read_text()), store).close()
+        print(
+            f"catalog: {db.stat().st_size / 2**20:.1f} MiB json,"
+            f" {store.stat().st_size / 2**20:.1f} MiB store"
+        )
+        print(f"{'loader':<8}{'startup':>12}{'rss':>12}{'anon':>12}{'request':>14}")
+        for loader in ("json", "store"):
+            results = [
+                run(loader, db, store, args.lookups, args.limit)
+                for _ in range(args.repeat)
+            ]
+            best = {key: min(r[key] for r in results) for key in results[0]}
+            print(
+                f"{loader:<8}{best['startup_ms']:>10.2f}ms{best['rss_mb']:>10.1f}MB"
+                f"{best['anon_mb']:>10.1f}MB{best['request_us']:>12.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
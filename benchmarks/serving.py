@@ -0,0 +1,364 @@
+"""
+Benchmark Serving Modes.
+
+Starts the api with local stand-ins for its upstreams, see `fakes.py`,
+and drives it with a mix of queries from many concurrent clients: popular
+queries that repeat, new queries, queries with constraints, model numbers,
+other languages and second pages, over laptops and optionally phones.
+Compares the Flask server of
+`salesman web` with the ASGI app of `salesman web --workers N`, reporting
+throughput, latency percentiles and the memory of the server processes.
+Results are saved as json and can be compared with an earlier run.
+
+    python -m benchmarks.serving --synthetic 2000 --concurrency 32
+    python -m benchmarks.serving --compare benchmarks/results/<earlier>.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+from backend.payload_store import PayloadStore
+
+from . import ROOT
+from .catalog import BRANDS, TARGET_USERS, WORDS, write_catalog
+
+RESULTS = ROOT.joinpath("benchmarks", "results")
+SERVER = r"""
+import json, sys
+from pathlib import Path
+from benchmarks.fakes import install
+from backend import api
+from backend.categories import CATEGORIES
+from backend.lexical import LexicalIndex
+
+options = json.loads(sys.argv[1])
+for category in CATEGORIES.values():
+    if category.db.exists() and not category.lexical.exists():
+        LexicalIndex.build(json.loads(category.db.read_text())).save(category.lexical)
+qdrant_path = Path(options["qdrant_path"])
+install(api.searcher, qdrant_path=qdrant_path, **options["fakes"])
+if options["mode"] == "flask":
+    api.app.run(port=options["port"])
+else:
+    from backend.asgi import serve
+    serve(port=options["port"], workers=options["workers"])
+"""
+TEMPLATES = {
+    "en": (
+        "{word} laptop for {user}",
+        "{brand} laptop under ${price}",
+        "{user} laptop with {ram}GB RAM",
+        "{brand} {word} laptop between ${price} and ${high}",
+    ),
+    "fr": (
+        "ordinateur portable {word} pour {user}",
+        "portable {brand} moins de {price} euros",
+    ),
+    "es": ("portátil {word} para {user}", "portátil {brand} barato"),
+    "de": ("laptop für {user} unter {price} euro", "günstig {brand} laptop"),
+}
+
+
+class QueryMix:
+    """A realistic mix of queries."""
+
+    def __init__(self, catalog: list[dict], popular: int = 200, seed: int = 0):
+        """
+        Initialize a query mix.
+
+        Args:
+            catalog: the laptops, their model numbers are searched for
+            popular: the number of queries that repeat
+            seed: the seed of the random number generator
+        """
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.mpns = [laptop["mpn"] for laptop in catalog]
+        self.popular = [self.new_query() for _ in range(popular)]
+        # popularity follows a zipf distribution
+        self.weights = [1 / rank for rank in range(1, popular + 1)]
+
+    def new_query(self) -> str:
+        """Generate a query in a random language."""
+        lang = self.rng.choices(("en", "fr", "es", "de"), (70, 10, 10, 10))[0]
+        price = self.rng.randrange(300, 3000, 50)
+        return self.rng.choice(TEMPLATES[lang]).format(
+            word=self.rng.choice(WORDS),
+            user=self.rng.choice(TARGET_USERS).lower(),
+            brand=self.rng.choice(BRANDS),
+            ram=self.rng.choice((8, 16, 32)),
+            price=price,
+            high=price + 500,
+        )
+
+    def next(self) -> tuple[str, bool]:
+        """
+        Get the next query.
+
+        Returns:
+            The query and whether its second page is asked for
+        """
+        with self.lock:
+            kind = self.rng.choices(("popular", "new", "mpn"), (60, 30, 10))[0]
+            if kind == "popular":
+                query = self.rng.choices(self.popular, self.weights)[0]
+            elif kind == "new":
+                query = self.new_query()
+            else:
+                query = self.rng.choice(self.mpns)
+            return query, self.rng.random() < 0.1
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port: int, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/search/warmup")
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"the server on port {port} didn't start")
+
+
+def rss_mb(pid: int) -> float:
+    """Get the resident memory of a process and its children."""
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f"/proc/{pid}/status") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{pid}/task/{pid}/children") as file:
+                pids.extend(int(child) for child in file.read().split())
+        except FileNotFoundError:
+            continue
+    return total / 1024
+
+
+def load(port: int, mix: QueryMix, concurrency: int, duration: float, limit: int):
+    """
+    Search from concurrent clients for a while.
+
+    Returns:
+        The throughput, latency percentiles and errors
+    """
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def get(connection, path):
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            body = response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            body, ok = b"", False
+        with lock:
+            nonlocal errors
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+        return json.loads(body) if ok else None
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while time.monotonic() < deadline:
+            query, second_page = mix.next()
+            path = f"/search/{quote(query, safe='')}?limit={limit}"
+            page = get(connection, path)
+            if second_page and page and page.get("next_cursor"):
+                get(connection, f"{path}&cursor={page['next_cursor']}")
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1e3 if latencies else np.array([np.nan])
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "qps": len(latencies) / elapsed,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "errors": errors,
+    }
+
+
+def run(mode: str, workers: int, database: Path, catalog: list[dict], args) -> dict:
+    """Start a server in its own process group, load it and stop it."""
+    # every mode starts with cold caches
+    for cache in database.glob("*.sqlite*"):
+        cache.unlink()
+    port = free_port()
+    env = {
+        **os.environ,
+        "SALESMAN_DATABASE": str(database),
+        "SALESMAN_SEARCH_BACKEND": args.backend,
+        "PYTHONPATH": str(ROOT),
+    }
+    options = {
+        "mode": mode,
+        "port": port,
+        "workers": workers,
+        "qdrant_path": str(database.joinpath(f"qdrant-{mode}-{workers}")),
+        "fakes": {
+            "dimension": args.dimension,
+            "embed_latency": args.embed_latency,
+            "detect_latency": args.detect_latency,
+            "translate_latency": args.translate_latency,
+            "qdrant_latency": args.qdrant_latency,
+        },
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER, json.dumps(options)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    try:
+        wait_until_up(port)
+        mix = QueryMix(catalog, seed=args.seed)
+        result = load(port, mix, args.concurrency, args.duration, args.limit)
+        result["rss_mb"] = rss_mb(server.pid)
+        return result
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+
+def report(results: dict, baseline: dict | None = None) -> None:
+    """Print results, with their change from a baseline."""
+    print(
+        f"{'mode':<12}{'qps':>9}{'p50':>11}{'p95':>11}{'p99':>11}"
+        f"{'rss':>10}{'errors':>8}"
+    )
+    for label, result in results.items():
+        print(
+            f"{label:<12}{result['qps']:>9.1f}{result['p50_ms']:>9.1f}ms"
+            f"{result['p95_ms']:>9.1f}ms{result['p99_ms']:>9.1f}ms"
+            f"{result['rss_mb']:>8.0f}MB{result['errors']:>8}"
+        )
+        before = (baseline or {}).get(label)
+        if before:
+            change = " ".join(
+                f"{key} {(result[key] / before[key] - 1) * 100:+.0f}%"
+                for key in ("qps", "p50_ms", "p95_ms", "p99_ms", "rss_mb")
+                if before[key]
+            )
+            print(f"{'':<12}{change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--synthetic", type=int, default=2000, help="catalog size")
+    parser.add_argument("--phones", type=int, default=0, help="phone catalog size")
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--backend", default="qdrant", help="SALESMAN_SEARCH_BACKEND")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--detect-latency", type=float, default=0.05)
+    parser.add_argument("--translate-latency", type=float, default=0.05)
+    parser.add_argument("--qdrant-latency", type=float, default=0.01)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--output", type=Path, help="where to save the results")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp)
+        db = write_catalog(database.joinpath("laptops_raw.json"), args.synthetic)
+        catalog = json.loads(db.read_text())
+        PayloadStore.build(catalog, database.joinpath("laptops.store"))
+        rng = np.random.default_rng(args.seed)
+        np.save(
+            database.joinpath("laptop_embeddings.npy"),
+            rng.standard_normal((args.synthetic, args.dimension), dtype=np.float32),
+        )
+        if args.phones:
+            # shaped like laptops, with the same ids
+            phones = write_catalog(
+                database.joinpath("phones_raw.json"), args.phones, args.seed + 1
+            )
+            PayloadStore.build(
+                json.loads(phones.read_text()), database.joinpath("phones.store")
+            )
+            np.save(
+                database.joinpath("phone_embeddings.npy"),
+                rng.standard_normal((args.phones, args.dimension), dtype=np.float32),
+            )
+        print(
+            f"{args.concurrency} clients, {args.backend} backend, {os.cpu_count()} cpus,"
+            f" {args.synthetic} laptops, {args.phones} phones,"
+            f" upstream latency embed {args.embed_latency * 1e3:.0f}ms,"
+            f" detect {args.detect_latency * 1e3:.0f}ms,"
+            f" translate {args.translate_latency * 1e3:.0f}ms,"
+            f" qdrant {args.qdrant_latency * 1e3:.0f}ms"
+        )
+        modes = [("flask", 1)] + [("asgi", workers) for workers in args.workers]
+        for mode, workers in modes:
+            label = mode if mode == "flask" else f"asgi x{workers}"
+            results[label] = run(mode, workers, database, catalog, args)
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+    report(results, baseline)
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+    ).stdout.strip()
+    output = args.output or RESULTS.joinpath(
+        f"serving-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "cpus": os.cpu_count(),
+        "options": {key: str(value) for key, value in vars(args).items()},
+        "results": results,
+    }, indent=2))
+    print(f"saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark Startup Time.
+
+Times how long each subcommand of `salesman` takes to start, from a new
+interpreter to its exit, and lists the heavy modules each one imports.
+Commands run against a synthetic catalog so parsing the database is part
+of the measurement. Results are saved as json and can be compared with an
+earlier run.
+
+    python -m benchmarks.startup --synthetic 20000 --repeat 10
+    python -m benchmarks.startup --compare benchmarks/results/<earlier>.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from . import ROOT
+from .catalog import write_catalog
+
+RESULTS = ROOT.joinpath("benchmarks", "results")
+HEAVY = ("numpy", "qdrant_client", "cohere", "translate", "flask", "fastapi")
+COMMANDS = {
+    "import backend": ["-c", "import backend"],
+    "--help": ["-m", "backend", "--help"],
+    "build --help": ["-m", "backend", "build", "--help"],
+    "interactive --help": ["-m", "backend", "interactive", "--help"],
+    "web --help": ["-m", "backend", "web", "--help"],
+}
+# reports the heavy modules a command imported when it exits
+PROBE = r"""
+import atexit, json, runpy, sys
+heavy, args = json.loads(sys.argv[1]), sys.argv[2:]
+atexit.register(lambda: print(
+    json.dumps([name for name in heavy if name in sys.modules]), file=sys.__stderr__
+))
+if args[0] == "-c":
+    exec(args[1])
+else:
+    sys.argv = [args[1], *args[2:]]
+    runpy.run_module(args[1], run_name="__main__", alter_sys=True)
+"""
+
+
+def time_command(args: list[str], env: dict, repeat: int) -> dict:
+    """
+    Time a command in new interpreters.
+
+    Returns:
+        The fastest and median wall time, and the heavy modules imported
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append((time.perf_counter() - start) * 1e3)
+    probe = subprocess.run(
+        [sys.executable, "-c", PROBE, json.dumps(HEAVY), *args],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return {
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "imports": json.loads(probe.stderr.strip().splitlines()[-1]),
+    }
+
+
+def report(results: dict, baseline: dict | None = None) -> None:
+    """Print results, with their change from a baseline."""
+    print(f"{'command':<22}{'min':>10}{'median':>10}  heavy imports")
+    for label, result in results.items():
+        line = (
+            f"{label:<22}{result['min_ms']:>8.0f}ms{result['median_ms']:>8.0f}ms"
+            f"  {', '.join(result['imports']) or '-'}"
+        )
+        before = (baseline or {}).get(label)
+        if before:
+            line += f"  ({(result['median_ms'] / before['median_ms'] - 1) * 100:+.0f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--synthetic", type=int, default=20000, help="catalog size")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="where to save the results")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp)
+        write_catalog(database.joinpath("laptops_raw.json"), args.synthetic)
+        env = {**os.environ, "SALESMAN_DATABASE": str(database), "PYTHONPATH": str(ROOT)}
+        for label, command in COMMANDS.items():
+            results[label] = time_command(command, env, args.repeat)
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+    report(results, baseline)
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+    ).stdout.strip()
+    output = args.output or RESULTS.joinpath(
+        f"startup-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "options": {key: str(value) for key, value in vars(args).items()},
+        "results": results,
+    }, indent=2))
+    print(f"saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark Local Vector Search.
+
+Measures query latency, vector memory and recall@k of the in-process
+vector indexes on a clustered random embedding matrix shaped like the
+laptop catalog.
+
+    python -m benchmarks.vector_index --size 6400 --dim 768
+    python -m benchmarks.vector_index --size 200000 --dim 768 --queries 200
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from backend import vector_index
+
+
+def measure(search, queries: np.ndarray, limit: int, batch: int) -> float:
+    """Get the mean latency of a query in microseconds."""
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        search(queries[i : i + batch], [limit] * len(queries[i : i + batch]))
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=int, default=6400)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # embeddings of similar laptops are close to each other
+    centers = rng.normal(size=(max(args.size // 50, 1), args.dim))
+    vectors = centers[rng.integers(len(centers), size=args.size)]
+    vectors = (vectors + rng.normal(scale=0.8, size=vectors.shape)).astype(np.float32)
+    queries = vectors[rng.integers(args.size, size=args.queries)]
+    queries = queries + rng.normal(scale=0.3, size=queries.shape).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, "embeddings.npy")
+        np.save(path, vectors)
+        start = time.perf_counter()
+        index = vector_index.ExactIndex(path, range(args.size))
+        load = (time.perf_counter() - start) * 1e3
+        print(f"{args.size} x {args.dim} vectors")
+        print(
+            f"{'index':<14}{'load':>10}{'memory':>10}{'query':>12}"
+            f"{'batch of 32':>14}{'recall':>10}"
+        )
+        limits = [args.limit] * len(queries)
+        expected = index.search_batch(queries, limits)
+        single = measure(index.search_batch, queries, args.limit, 1)
+        batched = measure(index.search_batch, queries, args.limit, 32)
+        memory = index.vectors.nbytes / 2**20
+        print(
+            f"{'exact':<14}{load:>8.1f}ms{memory:>7.1f}MiB{single:>10.1f}us"
+            f"{batched:>12.1f}us{1:>10.3f}"
+        )
+
+        for dtype in ("int8", "float16"):
+            quantized = vector_index.QuantizedIndex.build(
+                vectors, range(args.size), Path(tmp, dtype), dtype=dtype, originals=path
+            )
+            memory = quantized.codes.nbytes / 2**20
+            for rescore in (0, 4):
+                quantized.rescore = rescore
+                quantized.vectors = np.load(path, mmap_mode="r") if rescore else None
+                score = vector_index.recall(quantized.search_batch(queries, limits), expected)
+                single = measure(quantized.search_batch, queries, args.limit, 1)
+                batched = measure(quantized.search_batch, queries, args.limit, 32)
+                print(
+                    f"{f'{dtype}/{rescore}':<14}{'':>10}{memory:>7.1f}MiB{single:>10.1f}us"
+                    f"{batched:>12.1f}us{score:>10.3f}"
+                )
+
+        start = time.perf_counter()
+        ivf = vector_index.IVFIndex.build(vectors, range(args.size), Path(tmp, "ivf"))
+        print(f"ivf: {len(ivf.centroids)} lists built in {time.perf_counter() - start:.1f}s")
+        for probes in args.probes:
+            start = time.perf_counter()
+            ivf = vector_index.IVFIndex(Path(tmp, "ivf"), probes=probes)
+            load = (time.perf_counter() - start) * 1e3
+            score = vector_index.recall(ivf.search_batch(queries, limits), expected)
+            single = measure(ivf.search_batch, queries, args.limit, 1)
+            batched = measure(ivf.search_batch, queries, args.limit, 32)
+            print(
+                f"{f'ivf/{probes}':<14}{load:>8.1f}ms{'':>10}{single:>10.1f}us"
+                f"{batched:>12.1f}us{score:>10.3f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Test Fixtures.
+
+Every test runs against a database in a temporary directory, and the
+searchers it creates call a fake embedding model instead of Cohere.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+# the configuration reads its paths when it's first imported
+DATABASE = tempfile.mkdtemp(prefix="salesman-")
+atexit.register(shutil.rmtree, DATABASE, ignore_errors=True)
+os.environ["SALESMAN_DATABASE"] = DATABASE
+os.environ["SALESMAN_CATALOG_WATCH_INTERVAL"] = "0"
+os.environ["SALESMAN_SEARCH_BACKEND"] = "exact"
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from backend.categories import LAPTOPS, PHONES, Category  # noqa: E402
+from benchmarks.catalog import write_catalog  # noqa: E402
+from benchmarks.fakes import FakeCohere  # noqa: E402
+
+DIMENSION = 16
+
+
+def category_in(base: Category, path) -> Category:
+    """Move the files of a category to a directory."""
+    return base._replace(
+        db=path / base.db.name,
+        store=path / base.store.name,
+        vectors=path / base.vectors.name,
+        lexical=path / base.lexical.name,
+        ann_index=path / base.ann_index.name,
+        quantized=path / base.quantized.name,
+    )
+
+
+def build_catalog(category: Category, size: int, seed: int = 0) -> Category:
+    """Write a catalog of a category and its embeddings."""
+    write_catalog(category.db, size, seed=seed)
+    rng = np.random.default_rng(seed)
+    np.save(category.vectors, rng.standard_normal((size, DIMENSION)).astype(np.float32))
+    return category
+
+
+@pytest.fixture
+def build():
+    """Build catalogs, see `build_catalog`."""
+    return build_catalog
+
+
+@pytest.fixture
+def laptops(tmp_path) -> Category:
+    """The laptops, with their own files."""
+    return category_in(LAPTOPS, tmp_path)
+
+
+@pytest.fixture
+def phones(tmp_path) -> Category:
+    """The phones, with their own files."""
+    return category_in(PHONES, tmp_path)
+
+
+@pytest.fixture(scope="session")
+def catalog() -> Category:
+    """The laptops of the default database, searched by the apps."""
+    return build_catalog(LAPTOPS, 60)
+
+
+@pytest.fixture
+def model() -> FakeCohere:
+    """An embedding model that answers at once."""
+    return FakeCohere(DIMENSION, embed_latency=0, detect_latency=0)
@@ -0,0 +1,65 @@
+"""Tests of paging through search results, with both apps."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.fakes import FakeCohere
+
+from conftest import DIMENSION
+
+
+@pytest.fixture(scope="module")
+def searcher(catalog):
+    from backend import api
+
+    api.searcher.model = FakeCohere(DIMENSION, embed_latency=0, detect_latency=0)
+    return api.searcher
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def client(request, searcher):
+    if request.param == "flask":
+        from backend.api import app
+
+        return app.test_client()
+    from backend.asgi import app
+
+    return TestClient(app)
+
+
+def search(client, query: str, accept: str = "application/json", **params):
+    """Search with the test client of either app, get the status and the json."""
+    headers = {"Accept": accept}
+    if isinstance(client, TestClient):
+        response = client.get(f"/search/{query}", params=params, headers=headers)
+        return response.status_code, response.json()
+    response = client.get(f"/search/{query}", query_string=params, headers=headers)
+    return response.status_code, response.get_json()
+
+
+def test_cursor_pages_through_results(client):
+    status, first = search(client, "cheap laptop", limit=3)
+    assert status == 200
+    status, second = search(client, "cheap laptop", limit=3, cursor=first["next_cursor"])
+    assert status == 200
+    pages = first["recommendations"] + second["recommendations"]
+    assert len({laptop["id"] for laptop in pages}) == 6
+
+
+@pytest.mark.parametrize("accept", ["application/json", "application/x-ndjson"])
+def test_expired_cursor_is_gone(client, searcher, accept):
+    _, first = search(client, "gaming laptop", limit=2)
+    searcher.cursors.delete(first["next_cursor"])
+    status, body = search(
+        client, "gaming laptop", accept, limit=2, cursor=first["next_cursor"]
+    )
+    assert status == 410
+    assert "expired cursor" in body["error"]
+
+
+def test_cursor_of_another_query_is_gone(client):
+    _, first = search(client, "laptop", limit=2)
+    status, _ = search(client, "tablet", limit=2, cursor=first["next_cursor"])
+    assert status == 410
+    status, _ = search(client, "laptop", cursor="made-up")
+    assert status == 410
@@ -0,0 +1,84 @@
+"""Tests of sharing calls in flight."""
+
+import asyncio
+
+import pytest
+
+from backend.cache import SingleFlight
+
+
+def slow(calls: list, result="result", delay=0.05, error=None):
+    """Make a call that counts how many times it ran."""
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    return call
+
+
+def test_concurrent_calls_are_shared():
+    async def main():
+        flights, calls = SingleFlight(), []
+        results = await asyncio.gather(
+            *(flights.run("key", slow(calls)) for _ in range(5)),
+            flights.run("other", slow(calls, "other")),
+        )
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(main())
+    assert results == ["result"] * 5 + ["other"]
+    assert len(calls) == 2
+    assert flights.coalesced == 4
+    assert len(flights) == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def main():
+        flights, calls = SingleFlight(), []
+        first = asyncio.create_task(flights.run("key", slow(calls)))
+        second = asyncio.create_task(flights.run("key", slow(calls)))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return calls, await second
+
+    calls, result = asyncio.run(main())
+    assert result == "result"
+    assert len(calls) == 1
+
+
+def test_call_outlives_its_cancelled_callers():
+    async def main():
+        flights, calls = SingleFlight(), []
+        caller = asyncio.create_task(flights.run("key", slow(calls)))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        # a caller arriving later joins the call that is still running
+        result = await flights.run("key", slow(calls))
+        return flights, calls, result
+
+    flights, calls, result = asyncio.run(main())
+    assert result == "result"
+    assert len(calls) == 1
+    assert len(flights) == 0
+
+
+def test_failure_is_shared_and_not_kept():
+    async def main():
+        flights, calls = SingleFlight(), []
+        failing = slow(calls, error=RuntimeError("upstream down"))
+        results = await asyncio.gather(
+            flights.run("key", failing), flights.run("key", failing),
+            return_exceptions=True,
+        )
+        return flights, calls, results, await flights.run("key", slow(calls))
+
+    flights, calls, results, retried = asyncio.run(main())
+    assert [str(error) for error in results] == ["upstream down"] * 2
+    assert retried == "result"
+    assert len(calls) == 2
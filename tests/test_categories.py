@@ -0,0 +1,107 @@
+"""Tests of searching several categories together."""
+
+import logging
+
+from backend import deadline
+from backend.catalog import CatalogNotBuilt
+from backend.categories import merge_by_score
+from backend.laptops.embed_laptops import NeuralSearcher
+from backend.vector_index import Hit
+from benchmarks.catalog import write_catalog
+
+
+def ranking(first_id: int, *scores: float) -> list[Hit]:
+    """Rank hits with consecutive ids from their scores."""
+    return [Hit(first_id + i, score) for i, score in enumerate(scores)]
+
+
+def names(merged) -> list[str]:
+    """Get the category of each merged hit."""
+    return [name for name, _ in merged]
+
+
+def test_merge_by_score_without_quotas():
+    rankings = {"laptops": ranking(1, 0.9, 0.7, 0.5), "phones": ranking(11, 0.8, 0.6)}
+    merged = merge_by_score(rankings, 4, {})
+    assert [hit.score for _, hit in merged] == [0.9, 0.8, 0.7, 0.6]
+    assert names(merged) == ["laptops", "phones", "laptops", "phones"]
+
+
+def test_quota_keeps_a_share_of_the_page():
+    rankings = {
+        "laptops": ranking(1, *[0.9 - i / 100 for i in range(10)]),
+        "phones": ranking(11, 0.5, 0.4, 0.3),
+    }
+    merged = merge_by_score(rankings, 10, {"laptops": 0.2, "phones": 0.2})
+    assert len(merged) == 10
+    assert names(merged).count("phones") == 2
+    # the page is still ordered by score
+    assert names(merged)[-2:] == ["phones", "phones"]
+    assert merged[-2][1] == Hit(11, 0.5)
+
+
+def test_quota_is_capped_by_the_hits_of_a_category():
+    rankings = {"laptops": ranking(1, *[0.9] * 10), "phones": ranking(11, 0.1)}
+    merged = merge_by_score(rankings, 10, {"phones": 0.5})
+    assert names(merged).count("phones") == 1
+    assert len(merged) == 10
+
+
+def test_last_categories_give_way_on_a_short_page():
+    rankings = {"laptops": ranking(1, 0.1, 0.1, 0.1), "phones": ranking(11, 0.9, 0.9, 0.9)}
+    merged = merge_by_score(rankings, 5, {"laptops": 0.6, "phones": 0.6})
+    assert names(merged).count("laptops") == 3
+    assert names(merged).count("phones") == 2
+
+
+def test_single_category_is_cut_to_the_limit():
+    merged = merge_by_score({"phones": ranking(1, 0.3, 0.2, 0.1)}, 2, {"phones": 0.2})
+    assert merged == [("phones", Hit(1, 0.3)), ("phones", Hit(2, 0.2))]
+
+
+def test_category_with_only_a_database_is_skipped(laptops, phones, model, build, caplog):
+    build(laptops, 40)
+    write_catalog(phones.db, 20)
+    searcher = NeuralSearcher([laptops, phones], backend="exact")
+    searcher.model = model
+
+    with caplog.at_level(logging.WARNING):
+        for _ in range(3):
+            with deadline.budget() as budget:
+                ranks, _ = searcher.run(
+                    searcher.rank_many(["phone with a good camera", "cheap laptop"], [5, 5])
+                )
+            assert budget.degraded == set()
+            assert [len(keys) for keys in ranks] == [5, 5]
+            assert {name for keys in ranks for name, _ in keys} == {"laptops"}
+
+    assert list(searcher.snapshots) == ["laptops"]
+    warnings = [r for r in caplog.records if "phones aren't searched" in r.getMessage()]
+    assert len(warnings) == 1
+    assert not [r for r in caplog.records if r.exc_info]
+
+
+def test_category_is_searched_once_built(laptops, phones, model, build):
+    build(laptops, 40)
+    write_catalog(phones.db, 20)
+    searcher = NeuralSearcher([laptops, phones], backend="exact")
+    searcher.model = model
+    assert list(searcher.snapshots) == ["laptops"]
+
+    build(phones, 20, seed=1)
+    searcher.catalogs["phones"].reload()
+    assert list(searcher.snapshots) == ["laptops", "phones"]
+    ranks, _ = searcher.run(searcher.rank_many(["phone"], [5]))
+    assert {name for name, _ in ranks[0]} == {"phones"}
+
+
+def test_no_category_built_raises(laptops, model):
+    write_catalog(laptops.db, 20)
+    searcher = NeuralSearcher([laptops], backend="exact")
+    searcher.model = model
+    try:
+        searcher.snapshots
+    except CatalogNotBuilt:
+        pass
+    else:
+        raise AssertionError("searching a catalog that isn't built")
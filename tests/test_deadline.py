@@ -0,0 +1,70 @@
+"""Tests of the latency budget of searches."""
+
+import asyncio
+
+import pytest
+
+from backend import deadline
+from backend.cache import SingleFlight
+from backend.config import EMBED_BATCH_SIZE, SEARCH_DEADLINE, STAGE_DEADLINES
+from backend.deadline import Deadline, DeadlineExceeded
+
+
+@pytest.mark.parametrize(
+    "queries, calls",
+    [(0, 1), (1, 1), (EMBED_BATCH_SIZE, 1), (EMBED_BATCH_SIZE + 1, 2), (1000, 11)],
+)
+def test_batch_budget_grows_with_embedding_calls(queries, calls):
+    budget = Deadline.for_batch(queries)
+    assert budget.remaining() == pytest.approx(SEARCH_DEADLINE * calls, abs=0.05)
+    assert budget.stages == {
+        stage: seconds * calls for stage, seconds in STAGE_DEADLINES.items()
+    }
+    assert budget.timeout("embed") == STAGE_DEADLINES["embed"] * calls
+    # stages without a share may take whatever is left
+    assert budget.timeout("translate") == pytest.approx(SEARCH_DEADLINE * calls, abs=0.05)
+
+
+def test_batch_budget_leaves_the_default_alone():
+    Deadline.for_batch(1000)
+    assert Deadline().stages == STAGE_DEADLINES
+    assert Deadline().remaining() == pytest.approx(SEARCH_DEADLINE, abs=0.05)
+
+
+def test_stage_takes_at_most_what_is_left():
+    budget = Deadline(0.2, {"embed": 1.0, "detect_language": 0.1})
+    assert budget.timeout("embed") <= 0.2
+    assert budget.timeout("detect_language") == 0.1
+
+
+def test_late_stage_raises_and_degrades():
+    async def late():
+        await asyncio.sleep(1)
+
+    async def main():
+        with deadline.budget(Deadline(1, {"embed": 0.01})) as budget:
+            with pytest.raises(DeadlineExceeded):
+                await deadline.wait("embed", late())
+            deadline.degrade("embed")
+        return budget
+
+    assert asyncio.run(main()).degraded == {"embed"}
+
+
+def test_coalesced_call_keeps_the_stages_of_a_batch():
+    async def main():
+        seen = []
+
+        async def call():
+            seen.append(deadline.current_deadline().stages)
+            deadline.degrade("translate")
+            return "result"
+
+        with deadline.budget(Deadline.for_batch(500)) as budget:
+            result = await deadline.coalesce(SingleFlight(), "key", call)
+        return seen, result, budget
+
+    seen, result, budget = asyncio.run(main())
+    assert result == "result"
+    assert seen == [Deadline.for_batch(500).stages]
+    assert budget.degraded == {"translate"}
@@ -0,0 +1,22 @@
+"""Tests of how responses are projected and encoded."""
+
+import doctest
+
+from backend import encoding
+
+
+def test_doctests():
+    assert doctest.testmod(encoding).failed == 0
+
+
+def test_missing_nested_field_leaves_no_parent():
+    laptop = {"id": 1, "data": {"general": {"brand": "Dell"}, "battery": None}}
+    assert encoding.project(laptop, ("id", "data.battery.hours")) == {"id": 1}
+    assert encoding.project(laptop, ("data.display.size__inch",)) == {}
+    assert encoding.project(laptop, ("data.battery",)) == {"data": {"battery": None}}
+
+
+def test_fields_of_the_same_parent_are_merged():
+    laptop = {"data": {"general": {"brand": "Dell", "model": "XPS"}, "cpu": "i7"}}
+    fields = ("data.general.brand", "data.cpu", "data.general.model")
+    assert encoding.project(laptop, fields) == laptop
@@ -0,0 +1,95 @@
+"""Tests of query constraints."""
+
+import doctest
+
+import numpy as np
+from qdrant_client.models import FieldCondition, MatchAny, Range
+
+from backend import query_parser
+from backend.query_parser import (
+    Constraints,
+    FieldTable,
+    laptop_fields,
+    parse_query,
+    phone_fields,
+)
+
+
+def laptop(price=999.0, ram=16, brand="Dell", users="students, gamers"):
+    return {
+        "prices": [{"price": price, "currency": "USD"}, {"price": None}],
+        "target_user": users,
+        "data": {
+            "general": {"brand": brand},
+            "memory": {"ram__gb": ram},
+            "storage": {"capacity__gb": 512},
+            "display": {"size__inch": 15.6},
+        },
+    }
+
+
+def test_doctests():
+    assert doctest.testmod(query_parser).failed == 0
+
+
+def test_matches_ranges_and_keywords():
+    fields = laptop_fields(laptop())
+    assert Constraints().matches(fields)
+    assert Constraints(max_price=1000, min_ram_gb=16).matches(fields)
+    assert not Constraints(max_price=900).matches(fields)
+    assert not Constraints(min_ram_gb=32).matches(fields)
+    assert Constraints(brands=["hp", "dell"], target_users=["gamers"]).matches(fields)
+    assert not Constraints(brands=["hp"]).matches(fields)
+    assert not Constraints(target_users=["business professionals"]).matches(fields)
+
+
+def test_missing_value_fails_a_constraint_on_it():
+    fields = laptop_fields({**laptop(), "prices": []})
+    assert fields["price_usd"] is None
+    assert not Constraints(max_price=1000).matches(fields)
+    assert Constraints(min_ram_gb=8).matches(fields)
+
+
+def test_fields_a_category_lacks_are_ignored():
+    fields = phone_fields(laptop(price=400))
+    assert "ram_gb" not in fields
+    assert Constraints(max_price=500, min_ram_gb=64).matches(fields)
+    assert not Constraints(max_price=300, min_ram_gb=64).matches(fields)
+
+
+def test_to_filter():
+    constraints = parse_query("dell gaming laptop under $1000 with 16GB RAM")
+    conditions = {c.key: c for c in constraints.to_filter().must}
+    assert conditions["price_usd"] == FieldCondition(
+        key="price_usd", range=Range(lte=1000.0)
+    )
+    assert conditions["ram_gb"].range == Range(gte=16.0)
+    assert conditions["brand"].match == MatchAny(any=["dell"])
+    assert conditions["target_users"].match == MatchAny(any=["gamers"])
+
+
+def test_to_filter_keeps_the_fields_of_a_collection():
+    constraints = Constraints(max_price=500, min_ram_gb=16, target_users=["gamers"])
+    keys = phone_fields({})
+    assert [c.key for c in constraints.to_filter(keys).must] == ["price_usd"]
+    assert Constraints(min_ram_gb=16).to_filter(keys) is None
+    assert Constraints().to_filter() is None
+
+
+def test_mask_agrees_with_matches():
+    laptops = [
+        laptop(price=price, ram=ram, brand=brand)
+        for price in (400, 900, 1500)
+        for ram in (8, 16, 32)
+        for brand in ("Dell", "HP")
+    ]
+    table = FieldTable(laptops)
+    for constraints in (
+        Constraints(max_price=1000),
+        Constraints(min_ram_gb=16, brands=["hp"]),
+        Constraints(min_price=500, max_price=1000, target_users=["students"]),
+    ):
+        expected = [constraints.matches(laptop_fields(item)) for item in laptops]
+        assert table.mask(constraints).tolist() == expected
+    assert table.mask(Constraints()) is None
+    assert not np.any(table.mask(Constraints(brands=["acer"])))